@@ -17,10 +17,18 @@
 Actual benchmarks
 """
 import logging
+import threading
+import time
 
 import copy
-
-from hmsclient import HMSClient
+from contextlib import contextmanager
+
+from distributionstatistics import Statistics
+from fixtures import FixtureBuilder, PartitionLayout
+from hive_metastore.ttypes import ColumnStatisticsData, ColumnStatisticsObj, StringColumnStatsData, LockType, \
+    LockState
+from hmsclient import HMSClient, HMSClientPool
+from notifications import NotificationStream
 from tablebuilder import TableBuilder
 
 
@@ -85,7 +93,7 @@ def benchmark_drop_table(client, bench, db, table_name, owner):
 
 
 # noinspection SpellCheckingInspection
-def benchmark_list_tables(client, bench, db, table_name, owner, ntables):
+def benchmark_list_tables(client, bench, db, table_name, owner, ntables, fixtures=None):
     """
     Create ntables and measure time listing them
     :param client:
@@ -94,40 +102,39 @@ def benchmark_list_tables(client, bench, db, table_name, owner, ntables):
     :param table_name:
     :param owner:
     :param ntables:
+    :param fixtures: fixture builder used to create tables
+    :type fixtures: FixtureBuilder
     """
-    _create_many_tables(client, db, table_name, owner, ntables)
+    _create_many_tables(client, db, table_name, owner, ntables, fixtures)
     try:
         return bench.bench_simple(lambda: client.get_all_tables(db))
     finally:
-        _drop_many_tables(client, db, table_name, ntables)
+        _drop_many_tables(client, db, table_name, ntables, fixtures)
 
 
-def benchmark_get_table(client, bench, db, table_name, owner):
-    _create_many_tables(client, db, table_name, owner, 1)
+def benchmark_get_table(client, bench, db, table_name, owner, fixtures=None):
+    _create_many_tables(client, db, table_name, owner, 1, fixtures)
     try:
         return bench.bench_simple(lambda: client.get_table(db, table_name + '_0'))
     finally:
-        _drop_many_tables(client, db, table_name, 1)
+        _drop_many_tables(client, db, table_name, 1, fixtures)
+
+
+def _fixtures(client, fixtures):
+    """
+    :return: fixture builder, sequential one on the client if none is given
+    :rtype: FixtureBuilder
+    """
+    return fixtures if fixtures else FixtureBuilder(client)
 
 
 # noinspection SpellCheckingInspection
-def _create_many_tables(client, db, table_name, owner, ntables):
-    schema = HMSClient.make_schema(['name'])
-    logger = logging.getLogger(__name__)
-    logger.debug("creating %d tables for %s.%s", ntables, db, table_name)
-    for i in range(ntables):
-        table = TableBuilder(db, '{}_{}'.format(table_name, i)) \
-            .set_owner(owner) \
-            .set_columns(schema) \
-            .build()
-        client.create_table(table)
+def _create_many_tables(client, db, table_name, owner, ntables, fixtures=None):
+    _fixtures(client, fixtures).create_tables(db, table_name, owner, ntables)
 
 
-def _drop_many_tables(client, db, table_name, ntables):
-    logger = logging.getLogger(__name__)
-    logger.debug("dropping %d tables for %s.%s", ntables, db, table_name)
-    for i in range(ntables):
-        client.drop_table(db, '{}_{}'.format(table_name, i))
+def _drop_many_tables(client, db, table_name, ntables, fixtures=None):
+    _fixtures(client, fixtures).drop_tables(db, table_name, ntables)
 
 
 def benchmark_add_partition(client, bench, db, table_name, owner):
@@ -219,13 +226,12 @@ def benchmark_drop_partitions(client, bench, db, table_name, owner, count, need_
 
     tbl = client.get_table(db, table_name)
     names = ["date=d" + str(i) for i in range(count)]
-    print(names)
 
     partitions = [client.make_partition(tbl, ["d" + str(i)]) for i in range(count)]
     try:
         return bench.bench(
             lambda: client.add_partitions(partitions),
-            lambda: client.drop_partitions(db, names, need_result),
+            lambda: client.drop_partitions(db, table_name, names, need_result),
             None
         )
     finally:
@@ -233,65 +239,358 @@ def benchmark_drop_partitions(client, bench, db, table_name, owner, count, need_
         client.drop_table(db, table_name)
 
 
-def _create_many_partitions(client, db, table_name, owner, count):
-    logger = logging.getLogger(__name__)
-    logger.debug("creating %d partitions for table %s.%s", count, db, table_name)
-    schema = HMSClient.make_schema(['name'])
-    part_schema = HMSClient.make_schema(['date'])
-    logger.debug("creating table %s.%s", db, table_name)
-    table = TableBuilder(db, table_name)\
-        .set_owner(owner)\
-        .set_columns(schema)\
-        .set_partition_keys(part_schema)\
-        .build()
-    client.create_table(table)
-    tbl = client.get_table(db, table_name)
-    partitions = [client.make_partition(tbl, ["d" + str(i)]) for i in range(count)]
-    client.add_partitions(partitions)
+@contextmanager
+def _partitioned_table(client, db, table_name, owner, count, fixtures=None, read_only=True, layout=None):
+    """
+    Get table with count partitions for the duration of the benchmark
+
+    :param fixtures: fixture builder, shared read-only tables are kept until its teardown()
+    :type fixtures: FixtureBuilder
+    :param read_only: True if the benchmark leaves the table as it was
+    :param layout: partitioning with several keys
+    :type layout: PartitionLayout
+    :return: table
+    :rtype: Table
+    """
+    builder = _fixtures(client, fixtures)
+    name, table = builder.acquire_partitioned_table(db, table_name, owner, count, read_only, layout)
+    try:
+        yield table
+    finally:
+        builder.release(name)
+        if not fixtures:
+            builder.teardown()
 
 
-def benchmark_get_partitions(client, bench, db, table_name, owner, count):
+def benchmark_get_partitions(client, bench, db, table_name, owner, count, fixtures=None):
     logger = logging.getLogger(__name__)
-    _create_many_partitions(client, db, table_name, owner, count)
-    try:
+    with _partitioned_table(client, db, table_name, owner, count, fixtures) as table:
         logger.debug("measuring time to list %s partitions", count)
-        return bench.bench_simple(lambda: client.get_partitions(db, table_name))
-    finally:
-        logger.debug("dropping table %s.%s", db, table_name)
-        client.drop_table(db, table_name)
+        return bench.bench_simple(lambda: client.get_partitions(db, table.tableName))
 
 
-def benchmark_get_partition_names(client, bench, db, table_name, owner, count):
+def benchmark_get_partition_names(client, bench, db, table_name, owner, count, fixtures=None):
     logger = logging.getLogger(__name__)
-    _create_many_partitions(client, db, table_name, owner, count)
-    try:
+    with _partitioned_table(client, db, table_name, owner, count, fixtures) as table:
         logger.debug("measuring time to get names for %s partitions", count)
-        return bench.bench_simple(lambda: client.get_partition_names(db, table_name))
-    finally:
-        logger.debug("dropping table %s.%s", db, table_name)
-        client.drop_table(db, table_name)
+        return bench.bench_simple(lambda: client.get_partition_names(db, table.tableName))
 
 
 def benchmark_get_curr_notification(client, bench):
     return bench.bench_simple(lambda: client.get_current_notification_id())
 
 
-def benchmark_rename_table(client, bench, db, owner, count):
+def benchmark_rename_table(client, bench, db, owner, count, table_name="bench_table", fixtures=None):
     logger = logging.getLogger(__name__)
-    table_name = "bench_table"
     new_name = table_name + "_renamed"
-    _create_many_partitions(client, db, table_name, owner, count)
-    table = client.get_table(db, table_name)
-    table.sd.location = ""
-    new_table = copy.deepcopy(table)
-    new_table.tableName = new_name
-    try:
+    # Renames modify the table, so it can't be shared with other benchmarks
+    with _partitioned_table(client, db, table_name, owner, count, fixtures, read_only=False):
+        table = client.get_table(db, table_name)
+        table.sd.location = ""
+        new_table = copy.deepcopy(table)
+        new_table.tableName = new_name
         logger.debug("measuring time to rename table with %d partitions", count)
         return bench.bench(
             None,
             lambda: client.alter_table(db, table_name, new_table),
             lambda: client.alter_table(db, new_name, table)
         )
+
+
+def benchmark_get_partitions_by_filter(client, bench, db, table_name, owner, count, selectivity, fixtures=None):
+    """
+    Measure time to get partitions matching filter on a table partitioned by date, hour and region
+
+    :param count: number of partitions in the table
+    :type count: int
+    :param selectivity: fraction of partitions matching the filter
+    :type selectivity: float
+    :param fixtures: fixture builder
+    :type fixtures: FixtureBuilder
+    """
+    logger = logging.getLogger(__name__)
+    layout = PartitionLayout()
+    filter_expr = layout.filter(_selected(count, selectivity))
+    with _partitioned_table(client, db, table_name, owner, count, fixtures, layout=layout) as table:
+        logger.debug("measuring time to get partitions by filter %s", filter_expr)
+        return bench.bench_simple(lambda: client.get_partitions_by_filter(db, table.tableName, filter_expr))
+
+
+def benchmark_get_num_partitions_by_filter(client, bench, db, table_name, owner, count, selectivity,
+                                           fixtures=None):
+    """
+    Measure time to count partitions matching filter, see benchmark_get_partitions_by_filter()
+    """
+    logger = logging.getLogger(__name__)
+    layout = PartitionLayout()
+    filter_expr = layout.filter(_selected(count, selectivity))
+    with _partitioned_table(client, db, table_name, owner, count, fixtures, layout=layout) as table:
+        logger.debug("measuring time to count partitions by filter %s", filter_expr)
+        return bench.bench_simple(lambda: client.get_num_partitions_by_filter(db, table.tableName, filter_expr))
+
+
+def benchmark_get_partitions_by_expr(client, bench, db, table_name, owner, count, expr, fixtures=None):
+    """
+    Measure time to get partitions matching expression on a table partitioned by date, hour and region
+
+    :param expr: serialized Hive expression, e.g. captured from a Hive client
+    :type expr: bytes
+    """
+    logger = logging.getLogger(__name__)
+    with _partitioned_table(client, db, table_name, owner, count, fixtures, layout=PartitionLayout()) as table:
+        logger.debug("measuring time to get partitions by expression")
+        return bench.bench_simple(lambda: client.get_partitions_by_expr(db, table.tableName, expr))
+
+
+def _selected(count, selectivity):
+    """
+    :return: number of partitions selected with the given selectivity, at least one
+    :rtype: int
+    """
+    return min(count, max(1, int(round(count * selectivity))))
+
+
+def benchmark_notification_stream(client, bench, count, batch_size):
+    """
+    Measure time to read the last count notification events in batches of batch_size.
+    Events are read through NotificationStream, so fetching overlaps with consuming.
+
+    :param count: number of events to read
+    :type count: int
+    :param batch_size: number of events fetched at once
+    :type batch_size: int
+    :return: read time statistics, objects is the number of events actually read
+    """
+    logger = logging.getLogger(__name__)
+    last_event = client.get_current_notification_id()
+    first_event = max(0, last_event - count)
+    if last_event - first_event < count:
+        logger.warning("only %d notification events available", last_event - first_event)
+
+    def read():
+        stream = NotificationStream(client, first_event, batch_size, adaptive=False, stop_at=last_event)
+        try:
+            return sum(len(batch) for batch in stream.batches())
+        finally:
+            stream.close()
+
+    events = read()
+    result = bench.bench_simple(read)
+    result.objects = events
+    return result
+
+
+def _column_stats(db, table_name, count):
+    """
+    :return: statistics of the name column for partitions date=d0 ... date=d<count-1>
+    :rtype: list[ColumnStatistics]
+    """
+    data = ColumnStatisticsData(stringStats=StringColumnStatsData(maxColLen=16, avgColLen=8.0, numNulls=0, numDVs=100))
+    columns = [ColumnStatisticsObj('name', 'string', data)]
+    return [HMSClient.make_partition_column_statistics(db, table_name, 'date=d{}'.format(i), columns)
+            for i in range(count)]
+
+
+@contextmanager
+def _stats_table(client, db, table_name, owner, count, fixtures):
+    # Statistics benchmarks always write the same values, so they can share the table
+    with _partitioned_table(client, db, table_name + '_stats', owner, count, fixtures) as table:
+        yield table
+
+
+def benchmark_update_partition_stats(client, bench, db, table_name, owner, count, fixtures=None):
+    """
+    Measure time to update column statistics of count partitions with one call per partition
+    """
+    with _stats_table(client, db, table_name, owner, count, fixtures) as table:
+        stats = _column_stats(db, table.tableName, count)
+
+        def update():
+            for s in stats:
+                client.update_partition_column_statistics(s)
+
+        result = bench.bench_simple(update)
+        result.objects = count
+        return result
+
+
+def benchmark_set_partitions_stats(client, bench, db, table_name, owner, count, chunk_size, fixtures=None):
+    """
+    Measure time to update column statistics of count partitions in chunks of chunk_size,
+    chunks are sent concurrently over the fixtures connection pool
+    """
+    pool = fixtures.pool if fixtures else None
+    with _stats_table(client, db, table_name, owner, count, fixtures) as table:
+        stats = _column_stats(db, table.tableName, count)
+        result = bench.bench_simple(lambda: client.set_partitions_column_statistics(stats, chunk_size, pool))
+        result.objects = count
+        return result
+
+
+def benchmark_get_partitions_stats(client, bench, db, table_name, owner, count, chunk_size, fixtures=None):
+    """
+    Measure time to get column statistics of count partitions in chunks of chunk_size
+    """
+    pool = fixtures.pool if fixtures else None
+    with _stats_table(client, db, table_name, owner, count, fixtures) as table:
+        client.set_partitions_column_statistics(_column_stats(db, table.tableName, count), chunk_size, pool)
+        names = ['date=d{}'.format(i) for i in range(count)]
+        result = bench.bench_simple(lambda: client.get_partitions_column_statistics(
+            db, table.tableName, ['name'], names, chunk_size, pool))
+        result.objects = count
+        return result
+
+
+def benchmark_get_aggr_stats(client, bench, db, table_name, owner, count, fixtures=None):
+    """
+    Measure time to get column statistics aggregated over count partitions
+    """
+    pool = fixtures.pool if fixtures else None
+    with _stats_table(client, db, table_name, owner, count, fixtures) as table:
+        client.set_partitions_column_statistics(_column_stats(db, table.tableName, count), pool=pool)
+        names = ['date=d{}'.format(i) for i in range(count)]
+        result = bench.bench_simple(lambda: client.get_aggr_column_statistics(db, table.tableName, ['name'], names))
+        result.objects = count
+        return result
+
+
+def benchmark_open_txns(client, bench, count):
+    """
+    Measure time to open count transactions with one request, they are aborted after each measurement
+    """
+    txns = []
+
+    def abort():
+        for txn in txns:
+            client.abort_txn(txn)
+        del txns[:]
+
+    result = bench.bench(None, lambda: txns.extend(client.open_txns(count)), abort)
+    result.objects = count
+    return result
+
+
+def benchmark_commit_txn(client, bench):
+    txns = []
+    return bench.bench(
+        lambda: txns.extend(client.open_txns()),
+        lambda: client.commit_txn(txns.pop()),
+        None
+    )
+
+
+def benchmark_abort_txn(client, bench):
+    txns = []
+    return bench.bench(
+        lambda: txns.extend(client.open_txns()),
+        lambda: client.abort_txn(txns.pop()),
+        None
+    )
+
+
+def benchmark_lock(client, bench, lock_type, db, table_name, partition_name=None):
+    """
+    Measure time to acquire uncontended lock in a transaction, the transaction is committed after each measurement
+
+    :param lock_type: LockType value
+    :param partition_name: lock partition instead of table if set
+    """
+    components = [HMSClient.make_lock_component(lock_type, db, table_name, partition_name)]
+    txns = []
+
+    def commit():
+        client.commit_txn(txns.pop())
+
+    return bench.bench(
+        lambda: txns.extend(client.open_txns()),
+        lambda: client.lock(components, txns[-1]),
+        commit
+    )
+
+
+def benchmark_heartbeat(client, bench):
+    txn = client.open_txns()[0]
+    try:
+        return bench.bench_simple(lambda: client.heartbeat(txn))
     finally:
-        logger.debug("dropping table %s.%s", db, table_name)
-        client.drop_table(db, table_name)
+        client.abort_txn(txn)
+
+
+# Polling interval bounds for waiting locks, in seconds
+LOCK_POLL_MIN = 0.001
+LOCK_POLL_MAX = 0.05
+# Seconds lock contention workers wait for each other to start
+LOCK_START_TIMEOUT = 60
+
+
+def benchmark_lock_contention(client, bench, db, table_name, workers):
+    """
+    Several workers with their own connections repeatedly open a transaction,
+    lock the same table exclusively and commit.
+
+    Time spent in lock and check_lock calls is reported as 'rpc', the rest of the time
+    between the lock request and acquiring the lock is reported as 'wait'.
+    Waiting locks are polled with exponential backoff from LOCK_POLL_MIN to LOCK_POLL_MAX.
+
+    :param workers: number of concurrent workers
+    :type workers: int
+    :return: maps 'rpc' and 'wait' to statistics
+    :rtype: dict
+    """
+    logger = logging.getLogger(__name__)
+    components = [HMSClient.make_lock_component(LockType.EXCLUSIVE, db, table_name)]
+    barrier = threading.Barrier(workers, timeout=LOCK_START_TIMEOUT)
+
+    def lock(c, txn):
+        start = time.monotonic()
+        response = c.lock(components, txn)
+        rpc_time = time.monotonic() - start
+        delay = LOCK_POLL_MIN
+        while response.state == LockState.WAITING:
+            time.sleep(delay)
+            delay = min(delay * 2, LOCK_POLL_MAX)
+            call_start = time.monotonic()
+            response = c.check_lock(response.lockid)
+            rpc_time += time.monotonic() - call_start
+        if response.state != LockState.ACQUIRED:
+            raise RuntimeError('lock {} is in state {}'.format(response.lockid,
+                                                               LockState._VALUES_TO_NAMES.get(response.state)))
+        return rpc_time, time.monotonic() - start - rpc_time
+
+    def run(c, worker):
+        rpc, wait = Statistics(), Statistics()
+        # All workers start at once so they actually contend
+        barrier.wait()
+        for _ in range(bench.iterations):
+            txn = c.open_txns()[0]
+            try:
+                rpc_time, wait_time = lock(c, txn)
+            except Exception:
+                c.abort_txn(txn)
+                raise
+            c.commit_txn(txn)
+            rpc.add(rpc_time)
+            wait.add(wait_time)
+        logger.debug("worker %d: mean lock wait %g seconds", worker, wait.mean)
+        return rpc, wait
+
+    def on_done(future):
+        # A worker that failed, even before getting a connection, releases the others
+        if future.exception() is not None:
+            barrier.abort()
+
+    with HMSClientPool(client.host, client.port, workers) as pool:
+        bench.start()
+        futures = [pool.submit(run, worker) for worker in range(workers)]
+        for f in futures:
+            f.add_done_callback(on_done)
+        errors = [f.exception() for f in futures]
+    # Report the failure that broke the barrier rather than the workers it released
+    errors = sorted((e for e in errors if e is not None), key=lambda e: isinstance(e, threading.BrokenBarrierError))
+    if errors:
+        raise errors[0]
+    results = [f.result() for f in futures]
+    return {
+        'rpc': Statistics([v for rpc, _ in results for v in rpc.data]),
+        'wait': Statistics([v for _, wait in results for v in wait.data]),
+    }
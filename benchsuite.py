@@ -17,7 +17,12 @@ from __future__ import print_function
 
 import csv
 import logging
+import multiprocessing
+import os
 import re
+import sys
+import threading
+import traceback
 
 from microbench import MicroBench
 
@@ -25,12 +30,30 @@ from microbench import MicroBench
 class BenchSuite(object):
     __suite = dict()
     __result = dict()
+    # Guards __result against readers on other threads, e.g. the metrics endpoint
+    __lock = threading.Lock()
     # __benchmarks keeps track of the order in which tests are added to preserve it for runs
     __benchmarks = []
 
-    def __init__(self, bench=None, scale=1, sanitize=False):
+    def __init__(self, bench=None, scale=1, sanitize=False, isolate=False, on_fork=None, on_exit=None):
+        """
+        :param bench: MicroBench used by benchmarks
+        :param scale: time units scale for reports
+        :param sanitize: remove outliers from results
+        :param isolate: run every benchmark in a forked child process, so garbage and
+            caches left by earlier benchmarks do not affect it
+        :param on_fork: called in the child process before the benchmark,
+            e.g. to replace connections shared with the parent
+        :param on_exit: called in the child process after the benchmark,
+            e.g. to drop objects the benchmark created
+        """
+        if isolate and not hasattr(os, 'fork'):
+            raise ValueError('benchmark isolation requires os.fork()')
         self.__scale = scale
         self.__sanitize = sanitize
+        self.__isolate = isolate
+        self.__on_fork = on_fork
+        self.__on_exit = on_exit
         if not bench:
             bench = MicroBench()
         self.__bench = bench
@@ -70,22 +93,150 @@ class BenchSuite(object):
         return [n for n in self.__benchmarks if matches(n, filters)]
 
     def run(self, filters=None):
+        """
+        Run benchmarks matching filters. A failing benchmark is logged and left out
+        of the results, e.g. transaction benchmarks on HMS without ACID tables.
+
+        :return: names of failed benchmarks
+        :rtype: list[str]
+        """
+        failed = []
         for name in self.list(filters):
-            self.logger.debug('Running benchmark "%s"', name)
-            b = self.__suite[name]
-            result = b(self.__bench)
-            self.__result[name] = result if not self.__sanitize else result.sanitize()
+            try:
+                self.run_benchmark(name)
+            except Exception:
+                self.logger.exception('benchmark "%s" failed', name)
+                failed.append(name)
+        return failed
+
+    def run_benchmark(self, name):
+        """
+        Run single benchmark and record its result
+
+        :param name: benchmark name
+        :type name: str
+        :return: benchmark result, for benchmarks returning a dict of results
+            they are recorded as <name>.<key>
+        :rtype: Statistics
+        """
+        self.logger.debug('Running benchmark "%s"', name)
+        b = self.__suite[name]
+        result = self._run_isolated(name, b) if self.__isolate else self._run(name, b)
+        if isinstance(result, dict):
+            # Benchmark measured several things, e.g. RPC time and lock wait time
+            parts = {}
+            for part, value in result.items():
+                parts[part] = value if not self.__sanitize else value.sanitize()
+            with self.__lock:
+                for part, value in parts.items():
+                    self.__result['{}.{}'.format(name, part)] = value
+            return parts
+        result = result if not self.__sanitize else result.sanitize()
+        with self.__lock:
+            self.__result[name] = result
+        return result
+
+    def _run(self, name, b):
+        """
+        Run benchmark, with profiling when the MicroBench has a profiler
+        """
+        profiler = getattr(self.__bench, 'profiler', None)
+        if not profiler:
+            return b(self.__bench)
+        profiler.begin(name)
+        try:
+            return b(self.__bench)
+        finally:
+            profiler.end()
+
+    def _run_isolated(self, name, b):
+        """
+        Run benchmark in a child process and receive its result through a pipe
+
+        :param name: benchmark name
+        :param b: benchmark function
+        :return: benchmark result
+        :raises RuntimeError: if the benchmark fails in the child process
+        """
+        reader, writer = multiprocessing.Pipe(duplex=False)
+        # Buffered output would otherwise be written by both processes
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            reader.close()
+            try:
+                if self.__on_fork:
+                    self.__on_fork()
+                try:
+                    message = (True, self._run(name, b))
+                finally:
+                    if self.__on_exit:
+                        self.__on_exit()
+            except BaseException:
+                message = (False, traceback.format_exc())
+            status = 0
+            try:
+                writer.send(message)
+            except BaseException:
+                status = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+        writer.close()
+        try:
+            ok, result = reader.recv()
+        except EOFError:
+            ok, result = False, 'benchmark process exited without result'
+        finally:
+            reader.close()
+            os.waitpid(pid, 0)
+        profiler = getattr(self.__bench, 'profiler', None)
+        if profiler:
+            # The child wrote the profile with its copy of the profiler
+            profiler.record(name)
+        if not ok:
+            raise RuntimeError('benchmark failed in child process:\n' + result)
+        return result
+
+    def add_result(self, name, result):
+        """
+        Add result measured outside of run(), e.g. by trace replay
+
+        :param name: result name
+        :type name: str
+        :param result: measured data
+        :type result: Statistics
+        :return: self
+        """
+        result = result if not self.__sanitize else result.sanitize()
+        with self.__lock:
+            self.__result[name] = result
+        return self
+
+    @property
+    def bench(self):
+        return self.__bench
 
     @property
     def result(self):
         return self.__result
 
+    def snapshot(self):
+        """
+        :return: copy of results, safe to use while benchmarks are running on another thread
+        :rtype: dict
+        """
+        with self.__lock:
+            return dict(self.__result)
+
     def _min_mean(self):
         """
         :return: Return minimum Mean value across all suits
         :rtype: float
         """
-        return min([data.mean for data in self.__result.values()])
+        return min([data.mean for data in self.__result.values()] or [0.0])
 
     def print(self, file):
         file.write('{:30s}{:8s} {:8s} {:8s} {:8s} {:8s} {:8s}\n'.format('Name', 'AMean',
@@ -103,6 +254,91 @@ class BenchSuite(object):
                                result.max * self.__scale,
                                result.stdev * 100 / mean))
 
+    def print_throughput(self, file):
+        """
+        Print objects per second for benchmarks that process known number of objects per call
+        """
+        names = [n for n in sorted(self.__result.keys()) if getattr(self.__result[n], 'objects', None)]
+        if not names:
+            return
+        file.write('{:30s}{:10s} {:10s}\n'.format('Name', 'Objects', 'Objects/s'))
+        for name in names:
+            result = self.__result[name]
+            file.write('{:30s}{:<10d} {:<10.1f}\n'.format(name, result.objects, result.objects / result.mean))
+
+    def print_warmup(self, file):
+        """
+        Print number of warmup iterations used by every benchmark
+        """
+        names = [n for n in sorted(self.__result.keys()) if getattr(self.__result[n], 'warmup', None) is not None]
+        if not names:
+            return
+        file.write('{:30s}{:10s}\n'.format('Name', 'Warmup'))
+        for name in names:
+            file.write('{:30s}{:<10d}\n'.format(name, self.__result[name].warmup))
+
+    def print_gc(self, file):
+        """
+        Print garbage collections during measured calls and the share of measured time they took
+        """
+        names = [n for n in sorted(self.__result.keys()) if getattr(self.__result[n], 'gc_pauses', None) is not None]
+        if not names:
+            return
+        file.write('{:30s}{:10s} {:10s} {:10s}\n'.format('Name', 'GCPauses', 'GCTime', 'GCTime%'))
+        for name in names:
+            result = self.__result[name]
+            total = sum(result.data)
+            file.write('{:30s}{:<10d} {:<10.3g} {:<10.3g}\n'
+                       .format(name, result.gc_pauses, result.gc_time * self.__scale,
+                               result.gc_time * 100 / total if total else 0.0))
+
+    def print_memory(self, file):
+        """
+        Print client memory use of a single call and its largest allocation sites
+        """
+        names = [n for n in sorted(self.__result.keys()) if getattr(self.__result[n], 'memory', None)]
+        if not names:
+            return
+        file.write('{:30s}{:12s} {:12s}\n'.format('Name', 'PeakBytes', 'Retained'))
+        for name in names:
+            memory = self.__result[name].memory
+            file.write('{:30s}{:<12d} {:<12d}\n'.format(name, memory.peak, memory.retained))
+        for name in names:
+            file.write('\n{:60s}{:12s} {:10s}\n'.format(name, 'Bytes', 'Blocks'))
+            for site, size, count in self.__result[name].memory.sites:
+                file.write('  {:58s}{:<12d} {:<10d}\n'.format(site, size, count))
+
+    def _with_bytes(self):
+        return [n for n in sorted(self.__result.keys())
+                if getattr(self.__result[n], 'request_bytes', None) is not None]
+
+    def _bandwidth(self, result):
+        """
+        :return: (request bytes, response bytes, MB/s) for a single call
+        """
+        total = result.request_bytes + result.response_bytes
+        return result.request_bytes, result.response_bytes, total / result.mean / 1e6
+
+    def print_bandwidth(self, file):
+        """
+        Print mean request and response size and effective MB/s for benchmarks with byte counts
+        """
+        names = self._with_bytes()
+        if not names:
+            return
+        file.write('{:30s}{:10s} {:10s} {:10s}\n'.format('Name', 'ReqBytes', 'RespBytes', 'MB/s'))
+        for name in names:
+            file.write('{:30s}{:<10.0f} {:<10.0f} {:<10.3g}\n'.format(name, *self._bandwidth(self.__result[name])))
+
+    def print_bandwidth_csv(self, file, delimiter='\t'):
+        names = self._with_bytes()
+        if not names:
+            return
+        writer = csv.writer(file, delimiter=delimiter, quotechar='|', quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(['Name', 'ReqBytes', 'RespBytes', 'MB/s'])
+        for name in names:
+            writer.writerow([name] + ['{:g}'.format(v) for v in self._bandwidth(self.__result[name])])
+
     def print_csv(self, name, delimiter='\t'):
         if isinstance(name, str):
             with open(name, 'w', newline='') as f:
@@ -0,0 +1,353 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Bulk partition operations.
+
+Large partition sets are split into chunks sent concurrently over a connection pool.
+Chunk size adapts to observed call latency, so every call is one short HMS transaction
+no matter how many partitions there are in total.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from itertools import islice
+
+from thrift.transport.TTransport import TTransportException
+
+from hive_metastore.ttypes import MetaException
+
+# Errors that may be transient: broken connections, timeouts and server side database errors.
+# TApplicationException usually means a client or server bug, e.g. an unknown method, so it is not retried.
+RETRYABLE = (TTransportException, MetaException)
+DEFAULT_RETRIES = 3
+# Seconds before the first retry of a failed chunk, doubled for every further retry
+RETRY_DELAY = 0.5
+# Number of partitions fetched at once to find partitions to drop
+DEFAULT_PAGE_SIZE = 10000
+# Characters Hive escapes as %XX in partition names, see FileUtils.escapePathName
+_ESCAPED = set(chr(c) for c in range(1, 0x20)) | set('"#%\'*/:=?\\\x7f{[]^')
+
+
+class ChunkSizer(object):
+    """
+    Choose the number of objects per call so that calls take about target seconds.
+
+    The cost of one object is estimated from every completed call. The size grows
+    at most GROWTH times at once and halves after a failed call. Thread-safe.
+    """
+
+    DEFAULT_TARGET = 2.0
+    INITIAL = 100
+    MAXIMUM = 10000
+    GROWTH = 2
+
+    def __init__(self, target=DEFAULT_TARGET, initial=INITIAL, minimum=1, maximum=MAXIMUM):
+        """
+        :param target: desired call latency in seconds
+        :param initial: size of the first chunks
+        :param minimum: smallest chunk size
+        :param maximum: largest chunk size
+        """
+        self.__target = target
+        self.__minimum = minimum
+        self.__maximum = maximum
+        self.__size = max(minimum, min(initial, maximum))
+        self.__lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self.__size
+
+    def _clamp(self, size):
+        return int(max(self.__minimum, min(size, self.__maximum)))
+
+    def record(self, size, seconds):
+        """
+        :param size: number of objects in a completed call
+        :param seconds: call latency
+        """
+        with self.__lock:
+            estimate = self.__target * size / seconds if seconds > 0 else self.__maximum
+            self.__size = self._clamp(min(estimate, self.__size * self.GROWTH))
+
+    def failed(self):
+        with self.__lock:
+            self.__size = self._clamp(self.__size // 2)
+
+
+class BulkResult(object):
+    """
+    Outcome of a bulk operation
+    """
+
+    def __init__(self):
+        # Number of objects processed
+        self.count = 0
+        # Number of successful calls
+        self.calls = 0
+        # Number of failed calls that were retried
+        self.retries = 0
+        self.seconds = 0.0
+        # Objects returned by the server, when requested
+        self.partitions = []
+
+    @property
+    def rate(self):
+        """
+        :return: objects per second
+        :rtype: float
+        """
+        return self.count / self.seconds if self.seconds else 0.0
+
+
+def run_chunks(pool, fn, items, sizer=None, retries=DEFAULT_RETRIES, progress=None, retry_delay=RETRY_DELAY):
+    """
+    Call fn(client, chunk, retry) for chunks of items, concurrently over the pool.
+
+    At most pool.size chunks are in flight, items are consumed lazily. Chunks failing with
+    RETRYABLE errors are split in halves and retried with retry=True after a delay that doubles
+    with every attempt, so fn must be idempotent when retried. Other errors, or running out of
+    retries, stop the operation after calls in flight complete.
+
+    :param pool: connection pool
+    :type pool: HMSClientPool
+    :param fn: function(client, chunk, retry) returning list of objects to collect or None
+    :param items: iterable of objects
+    :param sizer: chunk size policy, adaptive with default target latency if None
+    :type sizer: ChunkSizer
+    :param retries: maximum number of times any item is retried
+    :param progress: progress counter, updated with the number of items in every completed chunk
+    :type progress: Progress
+    :param retry_delay: seconds before the first retry of a chunk
+    :rtype: BulkResult
+    """
+    logger = logging.getLogger(__name__)
+    sizer = sizer or ChunkSizer()
+    items = iter(items)
+    result = BulkResult()
+    # Maps future to (chunk, attempt)
+    pending = {}
+    # List of (time the chunk may be retried, chunk, attempt)
+    retry = []
+    start = time.monotonic()
+
+    def call(c, chunk, attempt):
+        call_start = time.monotonic()
+        value = fn(c, chunk, attempt > 0)
+        return value, time.monotonic() - call_start
+
+    def next_chunk():
+        if retry and retry[0][0] <= time.monotonic():
+            return retry.pop(0)[1:]
+        chunk = list(islice(items, sizer.size))
+        return (chunk, 0) if chunk else None
+
+    try:
+        while True:
+            while len(pending) < pool.size:
+                item = next_chunk()
+                if item is None:
+                    break
+                pending[pool.submit(call, *item)] = item
+            delay = max(0.0, retry[0][0] - time.monotonic()) if retry else None
+            if not pending:
+                if delay is None:
+                    break
+                time.sleep(delay)
+                continue
+            done, _ = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk, attempt = pending.pop(future)
+                error = future.exception()
+                if error is None:
+                    value, seconds = future.result()
+                    sizer.record(len(chunk), seconds)
+                    result.calls += 1
+                    result.count += len(chunk)
+                    if value:
+                        result.partitions.extend(value)
+                    if progress:
+                        progress.update(len(chunk))
+                    continue
+                if not isinstance(error, RETRYABLE) or attempt >= retries:
+                    if progress:
+                        progress.update(0, len(chunk))
+                    raise error
+                logger.warning('retrying %d objects after error: %s', len(chunk), error)
+                sizer.failed()
+                result.retries += 1
+                ready = time.monotonic() + retry_delay * 2 ** attempt
+                half = (len(chunk) + 1) // 2
+                retry.append((ready, chunk[:half], attempt + 1))
+                if chunk[half:]:
+                    retry.append((ready, chunk[half:], attempt + 1))
+                retry.sort(key=lambda r: r[0])
+    finally:
+        # Do not leave calls running behind the caller's back
+        wait(pending)
+        result.seconds = time.monotonic() - start
+    return result
+
+
+def add_partitions(pool, db_name, table_name, partitions, if_not_exists=False, need_result=False,
+                   sizer=None, retries=DEFAULT_RETRIES, progress=None):
+    """
+    Add any number of partitions with add_partitions_req calls of adaptive size.
+
+    Retried chunks are sent with ifNotExists, so partitions added by a call that failed
+    on the client side, e.g. with a timeout, are skipped. With need_result such partitions
+    are not returned.
+
+    :param pool: connection pool
+    :type pool: HMSClientPool
+    :param db_name: database name
+    :param table_name: table name
+    :param partitions: iterable of partitions, e.g. a generator, consumed lazily
+    :param if_not_exists: skip existing partitions instead of failing
+    :param need_result: collect added partitions in the result
+    :param sizer: chunk size policy
+    :type sizer: ChunkSizer
+    :param retries: maximum number of retries for every partition
+    :param progress: progress counter, updated with the number of partitions
+    :type progress: Progress
+    :return: result with partitions per second and added partitions if need_result is set
+    :rtype: BulkResult
+    """
+
+    def add(c, chunk, retry):
+        return c.add_partitions_req(db_name, table_name, chunk, if_not_exists or retry, need_result)
+
+    return run_chunks(pool, add, partitions, sizer, retries, progress)
+
+
+def escape_partition_value(value):
+    """
+    :return: value escaped the way Hive does in partition names
+    :rtype: str
+    """
+    return ''.join('%{:02X}'.format(ord(c)) if c in _ESCAPED else c for c in value)
+
+
+def partition_name(keys, values):
+    """
+    :param keys: partition key names
+    :param values: partition values
+    :return: partition name as HMS knows it, e.g. 'date=2020-01-01/hour=00'
+    :rtype: str
+    """
+    return '/'.join('{}={}'.format(escape_partition_value(k), escape_partition_value(v))
+                    for k, v in zip(keys, values))
+
+
+def range_filter(key, start=None, end=None):
+    """
+    Filter selecting partitions by a range of key values, compared as strings
+
+    :param key: partition key name
+    :param start: smallest value selected, no lower bound if None
+    :param end: first value after the range, no upper bound if None
+    :return: filter for get_partitions_by_filter() and drop_partitions(),
+        e.g. "date < '2020-01-01'" for end='2020-01-01'
+    :rtype: str
+    :raises ValueError: if a value contains both ' and "
+    """
+    if start is None and end is None:
+        raise ValueError('range of {} needs a start or an end'.format(key))
+
+    def quote(value):
+        # Filter string literals have no escapes, a value may only contain the other quote character
+        if "'" not in value:
+            return "'{}'".format(value)
+        if '"' not in value:
+            return '"{}"'.format(value)
+        raise ValueError('value of {} contains both quote characters: {}'.format(key, value))
+
+    conditions = []
+    if start is not None:
+        conditions.append('{} >= {}'.format(key, quote(start)))
+    if end is not None:
+        conditions.append('{} < {}'.format(key, quote(end)))
+    return ' and '.join(conditions)
+
+
+def _spec_values(specs):
+    """
+    :param specs: partition specs, see HMSClient.get_part_specs_by_filter()
+    :return: generator of partition value lists
+    """
+    for spec in specs:
+        parts = spec.sharedSDPartitionSpec or spec.partitionList
+        for p in parts.partitions if parts else []:
+            yield p.values
+
+
+def drop_partitions(client, pool, db_name, table_name, filter_expr, page_size=DEFAULT_PAGE_SIZE,
+                    delete_data=True, sizer=None, retries=DEFAULT_RETRIES, progress=None):
+    """
+    Drop any number of partitions matching a filter.
+
+    Names of matching partitions are found a page at a time from partition specs, which
+    carry one storage descriptor per location instead of one per partition, and dropped
+    in concurrent drop_partitions_req calls of adaptive size, so neither the name list
+    nor any single HMS transaction grows with the number of partitions. Names that no
+    longer exist are ignored, so retries are idempotent.
+
+    :param client: HMS client used to find partitions
+    :type client: HMSClient
+    :param pool: connection pool for drops
+    :type pool: HMSClientPool
+    :param db_name: database name
+    :param table_name: table name
+    :param filter_expr: HMS filter on partition keys, e.g. "date < '2020-01-01'", see range_filter()
+    :param page_size: maximum number of partitions fetched at once
+    :param delete_data: delete partition data as well, like drop_table() does
+    :param sizer: chunk size policy
+    :type sizer: ChunkSizer
+    :param retries: maximum number of retries for every partition
+    :param progress: progress counter, updated with the number of partitions
+    :type progress: Progress
+    :return: number of dropped partitions, calls, retries and partitions per second
+    :rtype: BulkResult
+    """
+    logger = logging.getLogger(__name__)
+    keys = [k.name for k in client.get_table(db_name, table_name).partitionKeys]
+    sizer = sizer or ChunkSizer()
+    total = BulkResult()
+    start = time.monotonic()
+    previous = set()
+
+    def drop(c, chunk, retry):
+        c.drop_partitions(db_name, table_name, chunk, delete_data=delete_data)
+
+    while True:
+        names = [partition_name(keys, values)
+                 for values in _spec_values(client.get_part_specs_by_filter(db_name, table_name, filter_expr,
+                                                                            page_size))]
+        if not names:
+            break
+        if previous.intersection(names):
+            raise RuntimeError('partitions of {}.{} were not dropped, e.g. {}'
+                               .format(db_name, table_name, sorted(previous.intersection(names))[0]))
+        logger.debug('dropping %d partitions of %s.%s', len(names), db_name, table_name)
+        page = run_chunks(pool, drop, names, sizer, retries, progress)
+        total.count += page.count
+        total.calls += page.calls
+        total.retries += page.retries
+        previous = set(names)
+    total.seconds = time.monotonic() - start
+    return total
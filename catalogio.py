@@ -0,0 +1,280 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Export and import of catalog metadata.
+
+The export file starts with MAGIC followed by records. Every record is a one-byte type
+(database, table or partition), a 4-byte big-endian length and the object serialized
+with Thrift binary protocol. Partitions follow their table and tables follow their database.
+The whole file may be gzip-compressed, readers detect it.
+"""
+
+import collections
+import gzip
+import logging
+import struct
+
+from thrift.TSerialization import serialize, deserialize
+
+from hive_metastore.ttypes import Database, Table, Partition, AlreadyExistsException
+from hmsclient import chunks
+
+MAGIC = b'HMSCAT1\n'
+
+DATABASE = b'D'
+TABLE = b'T'
+PARTITION = b'P'
+
+_TYPES = {DATABASE: Database, TABLE: Table, PARTITION: Partition}
+_HEADER = struct.Struct('>cI')
+_GZIP_MAGIC = b'\x1f\x8b'
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def encode(obj):
+    """
+    :param obj: Database, Table or Partition
+    :return: record bytes
+    :rtype: bytes
+    """
+    for record_type, cls in _TYPES.items():
+        if isinstance(obj, cls):
+            data = serialize(obj)
+            return _HEADER.pack(record_type, len(data)) + data
+    raise TypeError('can not export {}'.format(type(obj).__name__))
+
+
+def decode(record_type, data):
+    """
+    :param record_type: record type
+    :param data: serialized object
+    :return: Database, Table or Partition
+    """
+    return deserialize(_TYPES[record_type](), data)
+
+
+class CatalogWriter(object):
+    """
+    Write catalog records to a file
+    """
+
+    def __init__(self, path, compress=False):
+        """
+        :param path: output file
+        :param compress: gzip the output
+        """
+        self.__file = gzip.open(path, 'wb') if compress else open(path, 'wb')
+        self.__file.write(MAGIC)
+        self.__records = 0
+
+    @property
+    def records(self):
+        return self.__records
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, obj):
+        self.__file.write(encode(obj))
+        self.__records += 1
+
+    def close(self):
+        self.__file.close()
+
+
+class CatalogReader(object):
+    """
+    Read catalog records one at a time
+    """
+
+    def __init__(self, path):
+        """
+        :param path: file written by CatalogWriter, plain or compressed
+        """
+        with open(path, 'rb') as f:
+            compressed = f.read(len(_GZIP_MAGIC)) == _GZIP_MAGIC
+        self.__file = gzip.open(path, 'rb') if compressed else open(path, 'rb')
+        if self.__file.read(len(MAGIC)) != MAGIC:
+            self.__file.close()
+            raise ValueError('{} is not a catalog export'.format(path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __iter__(self):
+        """
+        :return: generator of Database, Table and Partition objects in file order
+        """
+        while True:
+            header = self.__file.read(_HEADER.size)
+            if not header:
+                return
+            if len(header) < _HEADER.size:
+                raise EOFError('truncated record header')
+            record_type, length = _HEADER.unpack(header)
+            data = self.__file.read(length)
+            if len(data) < length:
+                raise EOFError('truncated record')
+            yield decode(record_type, data)
+
+    def close(self):
+        self.__file.close()
+
+
+def _ordered(pool, fn, items, window):
+    """
+    Call fn(client, item) over the pool with at most window calls in flight
+
+    :return: generator of results in the order of items
+    """
+    pending = collections.deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def export_catalog(client, pool, writer, databases, tables, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """
+    Write databases, tables and their partitions.
+
+    Partitions are fetched by name in batches, a few batches ahead of the writer,
+    so at most a few batches of partition objects are held in memory. The names of
+    all partitions of a table are listed in one call and kept for the whole table,
+    since HMS cannot list partition names a page at a time; they take a small
+    fraction of the memory the partitions themselves would.
+
+    :param client: HMS client
+    :type client: HMSClient
+    :param pool: connection pool for prefetching partitions
+    :type pool: HMSClientPool
+    :param writer: output
+    :type writer: CatalogWriter
+    :param databases: names of databases to export
+    :param tables: (database, table) tuples to export, sorted by database
+    :param batch_size: number of partitions fetched at once
+    :param progress: progress counter, updated for every record
+    :type progress: Progress
+    """
+    logger = logging.getLogger(__name__)
+    by_db = collections.OrderedDict((db, []) for db in databases)
+    for db, t in tables:
+        by_db.setdefault(db, []).append(t)
+
+    def write(obj):
+        writer.write(obj)
+        if progress:
+            progress.update()
+
+    for db, names in by_db.items():
+        write(client.get_database(db))
+        for t in names:
+            logger.debug('exporting table %s.%s', db, t)
+            write(client.get_table(db, t))
+            batches = chunks(client.get_partition_names(db, t), batch_size)
+            fetch = lambda c, batch, db=db, t=t: c.get_partitions_by_names(db, t, batch)
+            for partitions in _ordered(pool, fetch, batches, pool.size * 2):
+                for p in partitions:
+                    write(p)
+
+
+def import_catalog(client, pool, reader, batch_size=DEFAULT_BATCH_SIZE, if_not_exists=False, progress=None):
+    """
+    Create objects read from an export.
+
+    Tables are created concurrently, partitions are added in batches with add_partitions_req
+    once their table exists. At most a few batches are in flight, so memory use is bounded.
+
+    :param client: HMS client
+    :type client: HMSClient
+    :param pool: connection pool for concurrent calls
+    :type pool: HMSClientPool
+    :param reader: input
+    :type reader: CatalogReader
+    :param batch_size: number of partitions added in one call
+    :param if_not_exists: skip databases, tables and partitions that already exist
+    :param progress: progress counter, updated for every record
+    :type progress: Progress
+    """
+    logger = logging.getLogger(__name__)
+    window = pool.size * 2
+    pending = collections.deque()
+    # Maps (database, table) to the future creating it
+    created = {}
+    batch = []
+
+    def wait(limit):
+        while len(pending) > limit:
+            count = pending.popleft().result()
+            if progress:
+                progress.update(count)
+
+    def create_table(c, table):
+        try:
+            c.create_table(table)
+        except AlreadyExistsException:
+            if not if_not_exists:
+                raise
+            logger.info('table %s.%s already exists', table.dbName, table.tableName)
+        return 1
+
+    def add_partitions(c, partitions):
+        created[(partitions[0].dbName, partitions[0].tableName)].result()
+        c.add_partitions_req(partitions[0].dbName, partitions[0].tableName, partitions, if_not_exists)
+        return len(partitions)
+
+    def flush():
+        if batch:
+            pending.append(pool.submit(add_partitions, list(batch)))
+            del batch[:]
+            wait(window)
+
+    for obj in reader:
+        if isinstance(obj, Partition):
+            if batch and (batch[0].dbName, batch[0].tableName) != (obj.dbName, obj.tableName):
+                flush()
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                flush()
+            continue
+        flush()
+        if isinstance(obj, Database):
+            # Tables can only be created in existing databases
+            wait(0)
+            try:
+                client.call('create_database', obj)
+            except AlreadyExistsException:
+                if not if_not_exists:
+                    raise
+                logger.info('database %s already exists', obj.name)
+            if progress:
+                progress.update()
+        else:
+            future = pool.submit(create_table, obj)
+            created[(obj.dbName, obj.tableName)] = future
+            pending.append(future)
+            wait(window)
+    flush()
+    wait(0)
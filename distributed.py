@@ -0,0 +1,268 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Distributed benchmark execution.
+
+The coordinator listens on a TCP socket and waits for the expected number of workers.
+Every worker gets its id, the list of benchmarks and the run configuration.
+Benchmarks run in lockstep: each worker reports that it is ready, the coordinator tells
+all of them to go at once, every worker sets up the objects the benchmark needs and reports
+that it is prepared, the coordinator starts measurement on all of them at once and then
+collects one latency histogram from every worker.
+
+Messages are JSON objects, one per line.
+"""
+
+import json
+import logging
+import socket
+
+from distributionstatistics import Histogram, Statistics
+
+DEFAULT_COORDINATOR_PORT = 9183
+# Seconds the coordinator waits for any worker message, including setup and measurement of one benchmark
+DEFAULT_TIMEOUT = 3600
+
+_HELLO = 'hello'
+_WELCOME = 'welcome'
+_READY = 'ready'
+_GO = 'go'
+_PREPARED = 'prepared'
+_START = 'start'
+_RESULT = 'result'
+_ERROR = 'error'
+
+
+class _Channel(object):
+    """
+    Line-delimited JSON messages over a socket
+    """
+
+    def __init__(self, sock):
+        self.__sock = sock
+        self.__file = sock.makefile('rw')
+
+    def send(self, message_type, **kwargs):
+        kwargs['type'] = message_type
+        self.__file.write(json.dumps(kwargs) + '\n')
+        self.__file.flush()
+
+    def receive(self, *expected_types):
+        line = self.__file.readline()
+        if not line:
+            raise EOFError('connection closed by peer')
+        message = json.loads(line)
+        if expected_types and message.get('type') not in expected_types + (_ERROR,):
+            raise ValueError('expected {} message, got {}'.format(' or '.join(expected_types), message.get('type')))
+        return message
+
+    def close(self):
+        self.__file.close()
+        self.__sock.close()
+
+
+def parse_address(address, default_port=DEFAULT_COORDINATOR_PORT):
+    """
+    :param address: host:port or host
+    :type address: str
+    :return: (host, port) tuple
+    """
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        return host, int(port)
+    return address, default_port
+
+
+class Coordinator(object):
+    """
+    Drive benchmarks on remote workers and merge their results
+    """
+
+    def __init__(self, workers, host='', port=DEFAULT_COORDINATOR_PORT, timeout=DEFAULT_TIMEOUT):
+        """
+        :param workers: number of workers to wait for
+        :type workers: int
+        :param host: address to listen on, all interfaces by default
+        :param port: port to listen on, 0 picks a free port
+        :param timeout: seconds to wait for every worker connection and message, None waits forever
+        """
+        self.__workers = workers
+        self.__timeout = timeout
+        self.__server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__server.settimeout(timeout)
+        self.__server.bind((host, port))
+        self.__server.listen(workers)
+        self.__channels = []
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def address(self):
+        """
+        :return: (host, port) the coordinator listens on
+        """
+        return self.__server.getsockname()
+
+    def run(self, benchmarks, config=None):
+        """
+        Run benchmarks on all workers
+
+        :param benchmarks: benchmark names in the order they should run
+        :type benchmarks: list[str]
+        :param config: run configuration passed to every worker
+        :type config: dict
+        :return: maps benchmark name to merged histogram, benchmarks failed on every worker are missing.
+            Benchmarks returning several results are recorded as <name>.<key>.
+        :rtype: dict
+        """
+        try:
+            self._accept(benchmarks, config or {})
+            results = {}
+            for name in benchmarks:
+                results.update(self._run_one(name))
+            return results
+        finally:
+            self.close()
+
+    def _accept(self, benchmarks, config):
+        self.logger.info('waiting for %d workers on %s:%d', self.__workers, *self.address)
+        while len(self.__channels) < self.__workers:
+            sock, peer = self.__server.accept()
+            sock.settimeout(self.__timeout)
+            channel = _Channel(sock)
+            channel.receive(_HELLO)
+            worker_id = len(self.__channels)
+            channel.send(_WELCOME, id=worker_id, benchmarks=benchmarks, config=config)
+            self.__channels.append(channel)
+            self.logger.info('worker %d connected from %s', worker_id, peer[0])
+
+    def _run_one(self, name):
+        for channel in self.__channels:
+            channel.receive(_READY)
+        self.logger.debug('setting up "%s" on %d workers', name, len(self.__channels))
+        for channel in self.__channels:
+            channel.send(_GO, name=name)
+        # Measurement starts once every worker has set up, workers failing in setup are left out
+        started = []
+        messages = {}
+        for worker_id, channel in enumerate(self.__channels):
+            message = channel.receive(_PREPARED, _RESULT)
+            if message['type'] == _PREPARED:
+                started.append(worker_id)
+            else:
+                messages[worker_id] = message
+        self.logger.debug('starting "%s" on %d workers', name, len(started))
+        for worker_id in started:
+            self.__channels[worker_id].send(_START, name=name)
+        for worker_id in started:
+            messages[worker_id] = self.__channels[worker_id].receive(_RESULT)
+        merged = {}
+        for worker_id in sorted(messages):
+            message = messages[worker_id]
+            if message['type'] == _ERROR:
+                self.logger.error('benchmark "%s" failed on worker %d: %s', name, worker_id, message['message'])
+                continue
+            for result_name, value in message['histograms'].items():
+                histogram = Histogram.from_dict(value)
+                if result_name in merged:
+                    merged[result_name].merge(histogram)
+                else:
+                    merged[result_name] = histogram
+        return merged
+
+    def close(self):
+        for channel in self.__channels:
+            channel.close()
+        self.__channels = []
+        self.__server.close()
+
+
+class Worker(object):
+    """
+    Run benchmarks on behalf of a coordinator
+    """
+
+    def __init__(self, host, port=DEFAULT_COORDINATOR_PORT):
+        self.__address = (host, port)
+        self.__channel = None
+        self.__welcome = None
+        self.__started = False
+        self.logger = logging.getLogger(__name__)
+
+    def connect(self):
+        """
+        Connect to the coordinator
+
+        :return: self
+        """
+        self.__channel = _Channel(socket.create_connection(self.__address))
+        self.__channel.send(_HELLO)
+        self.__welcome = self.__channel.receive(_WELCOME)
+        self.logger.info('connected to coordinator as worker %d', self.id)
+        return self
+
+    @property
+    def id(self):
+        return self.__welcome['id']
+
+    @property
+    def benchmarks(self):
+        return self.__welcome['benchmarks']
+
+    @property
+    def config(self):
+        return self.__welcome['config']
+
+    def start(self):
+        """
+        Report that the current benchmark is set up and wait until the coordinator starts
+        measurement on all workers, e.g. as MicroBench on_start. Only the first call for
+        every benchmark waits, so benchmarks measuring several things start once.
+        """
+        if self.__started:
+            return
+        self.__started = True
+        self.__channel.send(_PREPARED)
+        self.__channel.receive(_START)
+
+    def run(self, run_benchmark):
+        """
+        Run all benchmarks requested by the coordinator
+
+        :param run_benchmark: function taking benchmark name and returning Statistics or Histogram,
+            or a dict of them. It should call start() when setup is done, measurement of
+            benchmarks that never call it is not synchronized with other workers.
+        """
+        try:
+            for name in self.benchmarks:
+                self.__channel.send(_READY, name=name)
+                self.__channel.receive(_GO)
+                self.__started = False
+                try:
+                    result = run_benchmark(name)
+                except Exception as e:
+                    self.logger.exception('benchmark "%s" failed', name)
+                    self.__channel.send(_ERROR, name=name, message=str(e))
+                    continue
+                results = result if isinstance(result, dict) else {None: result}
+                histograms = {}
+                for part, value in results.items():
+                    if isinstance(value, Statistics):
+                        value = Histogram.from_statistics(value)
+                    histograms[name if part is None else '{}.{}'.format(name, part)] = value.to_dict()
+                self.__channel.send(_RESULT, name=name, histograms=histograms)
+        finally:
+            self.__channel.close()
@@ -15,6 +15,7 @@
 
 # noinspection PyCompatibility
 import logging
+import math
 import statistics
 
 
@@ -25,13 +26,104 @@ class Statistics(object):
 
     MARGIN = 2
 
-    def __init__(self, data=None):
+    def __init__(self, data=None, objects=None):
         self.__data = data if data else []
+        self.__objects = objects
+        self.__request_bytes = None
+        self.__response_bytes = None
+        self.__warmup = None
+        self.__gc_pauses = None
+        self.__gc_time = None
+        self.__memory = None
 
     @property
     def data(self):
         return self.__data
 
+    @property
+    def objects(self):
+        """
+        :return: number of objects processed by every measured call, if known
+        :rtype: int
+        """
+        return self.__objects
+
+    @objects.setter
+    def objects(self, value):
+        self.__objects = value
+
+    @property
+    def request_bytes(self):
+        """
+        :return: mean number of bytes sent by every measured call, if known
+        :rtype: float
+        """
+        return self.__request_bytes
+
+    @request_bytes.setter
+    def request_bytes(self, value):
+        self.__request_bytes = value
+
+    @property
+    def response_bytes(self):
+        """
+        :return: mean number of bytes received by every measured call, if known
+        :rtype: float
+        """
+        return self.__response_bytes
+
+    @response_bytes.setter
+    def response_bytes(self, value):
+        self.__response_bytes = value
+
+    @property
+    def warmup(self):
+        """
+        :return: number of warmup iterations before measurement, if known
+        :rtype: int
+        """
+        return self.__warmup
+
+    @warmup.setter
+    def warmup(self, value):
+        self.__warmup = value
+
+    @property
+    def gc_pauses(self):
+        """
+        :return: number of garbage collections during measured calls, if known
+        :rtype: int
+        """
+        return self.__gc_pauses
+
+    @gc_pauses.setter
+    def gc_pauses(self, value):
+        self.__gc_pauses = value
+
+    @property
+    def gc_time(self):
+        """
+        :return: total seconds spent in garbage collections during measured calls, if known
+        :rtype: float
+        """
+        return self.__gc_time
+
+    @gc_time.setter
+    def gc_time(self, value):
+        self.__gc_time = value
+
+    @property
+    def memory(self):
+        """
+        :return: client memory use of a single call, if measured
+        :rtype: MemoryUsage
+        """
+        return self.__memory
+
+    @memory.setter
+    def memory(self, value):
+        self.__memory = value
+
     def add(self, delta):
         self.__data.append(delta)
         return self
@@ -54,6 +146,8 @@ class Statistics(object):
 
     @property
     def stdev(self):
+        if len(self.data) < 2:
+            return 0.0
         return statistics.stdev(self.data)
 
     @property
@@ -71,6 +165,8 @@ class Statistics(object):
 
         :return: Sanitized statistic
         """
+        if len(self.data) < 2:
+            return self
         mean_value = self.mean
         delta = self.MARGIN * self.stdev
         min_val = mean_value - delta
@@ -78,7 +174,14 @@ class Statistics(object):
         new_data = [x for x in self.data if (min_val < x < max_val)]
         logger = logging.getLogger(__name__)
         logger.debug('dropped %s points with sanitization', len(self.data) - len(new_data))
-        return Statistics(new_data)
+        result = Statistics(new_data, self.__objects)
+        result.request_bytes = self.__request_bytes
+        result.response_bytes = self.__response_bytes
+        result.warmup = self.__warmup
+        result.gc_pauses = self.__gc_pauses
+        result.gc_time = self.__gc_time
+        result.memory = self.__memory
+        return result
 
     def write(self, name):
         """
@@ -90,3 +193,193 @@ class Statistics(object):
         with open(name, "w") as f:
             for v in self.data:
                 f.write(str(v) + "\n")
+
+
+class Histogram(object):
+    """
+    Mergeable latency histogram with logarithmic buckets.
+
+    Count, sum, min and max are exact, so mean and stdev are exact too,
+    while median and percentiles are within the bucket precision.
+    Histograms from different processes can be merged and sent over the wire
+    as dictionaries.
+    """
+
+    # Relative bucket width
+    PRECISION = 0.01
+
+    def __init__(self, precision=PRECISION):
+        self.__precision = precision
+        self.__log_base = math.log1p(precision)
+        self.__buckets = {}
+        self.__count = 0
+        self.__sum = 0.0
+        self.__sum_squares = 0.0
+        self.__min = None
+        self.__max = None
+
+    @classmethod
+    def from_statistics(cls, stats, precision=PRECISION):
+        """
+        Build histogram from raw data
+
+        :param stats: raw data
+        :type stats: Statistics
+        :rtype: Histogram
+        """
+        result = cls(precision)
+        for v in stats.data:
+            result.add(v)
+        return result
+
+    def _bucket(self, value):
+        # Non-positive values go to a single bucket
+        if value <= 0:
+            return None
+        return int(math.floor(math.log(value) / self.__log_base))
+
+    def _value(self, bucket):
+        if bucket is None:
+            return 0.0
+        # Geometric middle of the bucket
+        return math.exp((bucket + 0.5) * self.__log_base)
+
+    def add(self, value):
+        bucket = self._bucket(value)
+        self.__buckets[bucket] = self.__buckets.get(bucket, 0) + 1
+        self.__count += 1
+        self.__sum += value
+        self.__sum_squares += value * value
+        self.__min = value if self.__min is None else min(self.__min, value)
+        self.__max = value if self.__max is None else max(self.__max, value)
+        return self
+
+    def merge(self, other):
+        """
+        Add all values from other histogram
+
+        :param other: histogram with the same precision
+        :type other: Histogram
+        :return: self
+        """
+        if other.precision != self.__precision:
+            raise ValueError('can not merge histograms with different precision')
+        for bucket, count in other.buckets.items():
+            self.__buckets[bucket] = self.__buckets.get(bucket, 0) + count
+        self.__count += other.count
+        self.__sum += other.sum
+        self.__sum_squares += other.sum_squares
+        if other.count:
+            self.__min = other.min if self.__min is None else min(self.__min, other.min)
+            self.__max = other.max if self.__max is None else max(self.__max, other.max)
+        return self
+
+    @property
+    def precision(self):
+        return self.__precision
+
+    @property
+    def buckets(self):
+        return self.__buckets
+
+    @property
+    def count(self):
+        return self.__count
+
+    @property
+    def sum(self):
+        return self.__sum
+
+    @property
+    def sum_squares(self):
+        return self.__sum_squares
+
+    @property
+    def mean(self):
+        return self.__sum / self.__count
+
+    @property
+    def min(self):
+        return self.__min
+
+    @property
+    def max(self):
+        return self.__max
+
+    @property
+    def variance(self):
+        if self.__count < 2:
+            return 0.0
+        mean = self.mean
+        return max(0.0, (self.__sum_squares - self.__count * mean * mean) / (self.__count - 1))
+
+    @property
+    def stdev(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def median(self):
+        return self.percentile(50)
+
+    def percentile(self, p):
+        """
+        :param p: percentile between 0 and 100
+        :return: approximate value of the percentile, clamped to the observed min and max
+        """
+        if not self.__count:
+            raise ValueError('percentile of empty histogram')
+        rank = p / 100.0 * self.__count
+        seen = 0
+        buckets = sorted(self.__buckets.keys(), key=lambda b: -float('inf') if b is None else b)
+        for bucket in buckets:
+            seen += self.__buckets[bucket]
+            if seen >= rank:
+                return min(self.__max, max(self.__min, self._value(bucket)))
+        return self.__max
+
+    def cumulative(self, bounds):
+        """
+        Count values not greater than each bound, e.g. for Prometheus histogram buckets
+
+        :param bounds: increasing upper bounds
+        :return: approximate number of values not greater than every bound
+        :rtype: list[int]
+        """
+        counts = [0] * len(bounds)
+        for bucket, count in self.__buckets.items():
+            value = self._value(bucket)
+            for i, bound in enumerate(bounds):
+                if value <= bound:
+                    counts[i] += count
+        return counts
+
+    def to_dict(self):
+        """
+        :return: JSON-serializable representation
+        :rtype: dict
+        """
+        return {
+            'precision': self.__precision,
+            'count': self.__count,
+            'sum': self.__sum,
+            'sum_squares': self.__sum_squares,
+            'min': self.__min,
+            'max': self.__max,
+            'buckets': [[b, c] for b, c in self.__buckets.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, value):
+        """
+        :param value: value produced by to_dict()
+        :type value: dict
+        :rtype: Histogram
+        """
+        result = cls(value['precision'])
+        result.__count = value['count']
+        result.__sum = value['sum']
+        result.__sum_squares = value['sum_squares']
+        result.__min = value['min']
+        result.__max = value['max']
+        result.__buckets = {b: c for b, c in value['buckets']}
+        return result
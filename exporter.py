@@ -0,0 +1,218 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark and client metrics in OpenMetrics text format.
+
+Output can be written to a file for the node-exporter textfile collector
+or served over HTTP for Prometheus to scrape.
+"""
+
+import logging
+import os
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from distributionstatistics import Histogram
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# Histogram bucket bounds for client call latency, in seconds
+LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+# Quantiles reported for benchmark results
+QUANTILES = [0.5, 0.9, 0.99]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, _escape(v)) for k, v in labels) + '}'
+
+
+class _Family(object):
+    """
+    Metric family: TYPE and HELP lines followed by samples
+    """
+
+    def __init__(self, name, metric_type, help_text, unit=None):
+        self.name = name
+        self.lines = ['# TYPE {} {}'.format(name, metric_type)]
+        if unit:
+            self.lines.append('# UNIT {} {}'.format(name, unit))
+        self.lines.append('# HELP {} {}'.format(name, help_text))
+
+    def sample(self, suffix, labels, value):
+        # Counts stay integers, as OpenMetrics requires for histogram buckets
+        text = str(value) if isinstance(value, int) else repr(float(value))
+        self.lines.append('{}{}{} {}'.format(self.name, suffix, _labels(labels), text))
+
+
+def _quantile(data, q):
+    ordered = sorted(data)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def suite_metrics(result, prefix='hbench'):
+    """
+    :param result: benchmark results, as returned by BenchSuite.result
+    :type result: dict
+    :param prefix: metric name prefix
+    :return: metric families for the results
+    :rtype: list[_Family]
+    """
+    latency = _Family(prefix + '_latency_seconds', 'summary', 'Benchmark call latency', 'seconds')
+    objects = _Family(prefix + '_objects', 'gauge', 'Objects processed by every benchmark call')
+    sent = _Family(prefix + '_request_bytes', 'gauge', 'Mean bytes sent by every benchmark call', 'bytes')
+    received = _Family(prefix + '_response_bytes', 'gauge', 'Mean bytes received by every benchmark call', 'bytes')
+    peak = _Family(prefix + '_peak_memory_bytes', 'gauge', 'Client heap peak during a benchmark call', 'bytes')
+    retained = _Family(prefix + '_retained_memory_bytes', 'gauge',
+                       'Client heap still allocated after a benchmark call', 'bytes')
+    for name in sorted(result.keys()):
+        stats = result[name]
+        labels = [('benchmark', name)]
+        if isinstance(stats, Histogram):
+            for q in QUANTILES:
+                latency.sample('', labels + [('quantile', q)], stats.percentile(q * 100))
+            latency.sample('_sum', labels, stats.sum)
+            latency.sample('_count', labels, stats.count)
+            continue
+        if not stats.data:
+            continue
+        for q in QUANTILES:
+            latency.sample('', labels + [('quantile', q)], _quantile(stats.data, q))
+        latency.sample('_sum', labels, sum(stats.data))
+        latency.sample('_count', labels, len(stats.data))
+        if stats.objects:
+            objects.sample('', labels, stats.objects)
+        if stats.request_bytes is not None:
+            sent.sample('', labels, stats.request_bytes)
+            received.sample('', labels, stats.response_bytes)
+        if stats.memory:
+            peak.sample('', labels, stats.memory.peak)
+            retained.sample('', labels, stats.memory.retained)
+    return [latency, objects, sent, received, peak, retained]
+
+
+def client_metrics(method_stats, prefix='hms_client'):
+    """
+    :param method_stats: client call statistics
+    :type method_stats: MethodStats
+    :param prefix: metric name prefix
+    :return: metric families for every called method
+    :rtype: list[_Family]
+    """
+    latency = _Family(prefix + '_call_duration_seconds', 'histogram', 'HMS call latency', 'seconds')
+    errors = _Family(prefix + '_call_errors', 'counter', 'Failed HMS calls')
+    cpu = _Family(prefix + '_call_cpu_seconds', 'counter', 'Client CPU time spent in HMS calls', 'seconds')
+    sent = _Family(prefix + '_request_bytes', 'counter', 'Bytes sent in HMS calls', 'bytes')
+    received = _Family(prefix + '_response_bytes', 'counter', 'Bytes received in HMS calls', 'bytes')
+    for method, s in sorted(method_stats.snapshot().items()):
+        labels = [('method', method)]
+        histogram = Histogram.from_dict(s['latency'])
+        for bound, count in zip(LATENCY_BUCKETS, histogram.cumulative(LATENCY_BUCKETS)):
+            latency.sample('_bucket', labels + [('le', bound)], count)
+        latency.sample('_bucket', labels + [('le', '+Inf')], histogram.count)
+        latency.sample('_sum', labels, histogram.sum)
+        latency.sample('_count', labels, histogram.count)
+        errors.sample('_total', labels, s['errors'])
+        cpu.sample('_total', labels, s['cpu'])
+        sent.sample('_total', labels, s['request_bytes'])
+        received.sample('_total', labels, s['response_bytes'])
+    return [latency, errors, cpu, sent, received]
+
+
+def render(families):
+    """
+    :param families: metric families
+    :return: OpenMetrics text
+    :rtype: str
+    """
+    lines = []
+    for family in families:
+        lines.extend(family.lines)
+    lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(path, text):
+    """
+    Write metrics atomically, so the textfile collector never reads a partial file
+
+    :param path: output file, should end with .prom for the textfile collector
+    :param text: rendered metrics
+    """
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.rename(tmp, path)
+
+
+class MetricsServer(object):
+    """
+    Serve metrics over HTTP from a background thread.
+
+    Every request to any path calls the render function, so metrics are always current.
+    """
+
+    def __init__(self, render_metrics, port, host='localhost'):
+        """
+        :param render_metrics: function returning OpenMetrics text
+        :param port: port to listen on, 0 picks a free port
+        :param host: address to listen on, localhost by default
+        """
+        logger = logging.getLogger(__name__)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = render_metrics().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                logger.debug(fmt, *args)
+
+        self.__server = HTTPServer((host, port), Handler)
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name='metrics-server')
+        self.__thread.daemon = True
+
+    @property
+    def address(self):
+        return self.__server.server_address
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        self.__thread.start()
+        return self
+
+    def close(self):
+        self.__server.shutdown()
+        self.__server.server_close()
@@ -0,0 +1,327 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Creation of benchmark fixtures - tables and partitions that benchmarks need to exist
+"""
+
+import datetime
+import logging
+import time
+
+from hmsclient import HMSClient, chunks
+from tablebuilder import TableBuilder
+
+
+class PartitionLayout(object):
+    """
+    Partitioning by date, hour and region.
+
+    Partitions are numbered in the lexicographic order of their values, so the first
+    m partitions can be selected with a filter on partition keys. This gives
+    filters with exact selectivity.
+    """
+
+    KEYS = ['date', 'hour', 'region']
+    FIRST_DATE = datetime.date(2000, 1, 1)
+
+    def __init__(self, hours=24, regions=4):
+        self.__sizes = [hours, regions]
+
+    @property
+    def name(self):
+        return 'dhr'
+
+    @property
+    def keys(self):
+        return self.KEYS
+
+    def _digits(self, index):
+        """
+        :return: values of every key for the partition number as integers
+        """
+        digits = []
+        for size in reversed(self.__sizes):
+            index, digit = divmod(index, size)
+            digits.append(digit)
+        return [index] + list(reversed(digits))
+
+    def _format(self, key, digit):
+        if key == 0:
+            return (self.FIRST_DATE + datetime.timedelta(days=digit)).isoformat()
+        if key == 1:
+            return '{:02d}'.format(digit)
+        return 'r{:02d}'.format(digit)
+
+    def values(self, index):
+        """
+        :param index: partition number
+        :type index: int
+        :return: partition values
+        :rtype: list[str]
+        """
+        return [self._format(k, d) for k, d in enumerate(self._digits(index))]
+
+    def filter(self, count):
+        """
+        Filter selecting first count partitions, e.g. for count 30 with 24 hours and 4 regions:
+        (date = '2000-01-01' and hour < '07') or (date = '2000-01-01' and hour = '07' and region < 'r02')
+
+        :param count: number of partitions to select
+        :type count: int
+        :rtype: str
+        """
+        digits = self._digits(count)
+        clauses = []
+        for k, digit in enumerate(digits):
+            if not digit:
+                continue
+            terms = ["{} = '{}'".format(self.KEYS[j], self._format(j, digits[j])) for j in range(k)]
+            terms.append("{} < '{}'".format(self.KEYS[k], self._format(k, digit)))
+            clauses.append('(' + ' and '.join(terms) + ')')
+        return ' or '.join(clauses)
+
+
+class _Fixture(object):
+    def __init__(self, value, drop, shared):
+        self.value = value
+        self.drop = drop
+        self.shared = shared
+        self.refs = 1
+
+
+class FixtureBuilder(object):
+    """
+    Create and drop benchmark fixtures.
+
+    Tables are created and dropped concurrently over the connection pool,
+    partitions are added in batches with one add_partitions_req call per batch.
+    Without a pool everything runs sequentially on the client.
+
+    Fixtures acquired read-only are cached by name and shared by all benchmarks
+    that need them; they are dropped by teardown() at the end of the suite.
+    Read-write fixtures belong to a single benchmark and are dropped on release.
+    """
+
+    DEFAULT_BATCH_SIZE = 1000
+
+    def __init__(self, client, pool=None, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        :param client: HMS client
+        :type client: HMSClient
+        :param pool: connection pool for concurrent calls
+        :type pool: HMSClientPool
+        :param batch_size: number of partitions added in one call
+        :type batch_size: int
+        """
+        self.__client = client
+        self.__pool = pool
+        self.__batch_size = batch_size
+        # List of (operation, number of objects, seconds) tuples
+        self.__setup = []
+        # Maps fixture name to _Fixture
+        self.__fixtures = {}
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def pool(self):
+        """
+        :return: connection pool, if any
+        :rtype: HMSClientPool
+        """
+        return self.__pool
+
+    @property
+    def setup(self):
+        """
+        :return: list of (operation, number of objects, seconds) for every setup step
+        :rtype: list
+        """
+        return self.__setup
+
+    def _map(self, fn, items):
+        if self.__pool:
+            return self.__pool.map(fn, items)
+        return [fn(self.__client, item) for item in items]
+
+    def _record(self, operation, count, start):
+        elapsed = time.monotonic() - start
+        self.__setup.append((operation, count, elapsed))
+        self.logger.info('%s: %d objects in %.3g seconds (%.1f objects/sec)',
+                         operation, count, elapsed, count / elapsed if elapsed else 0.0)
+
+    def create_tables(self, db, table_name, owner, count):
+        """
+        Create tables table_name_0 ... table_name_<count-1>
+
+        :param db: database name
+        :param table_name: table name prefix
+        :param owner: table owner
+        :param count: number of tables
+        :type count: int
+        """
+        schema = HMSClient.make_schema(['name'])
+        self.logger.debug("creating %d tables for %s.%s", count, db, table_name)
+        start = time.monotonic()
+
+        def create(client, i):
+            client.create_table(TableBuilder(db, '{}_{}'.format(table_name, i))
+                                .set_owner(owner)
+                                .set_columns(schema)
+                                .build())
+
+        self._map(create, range(count))
+        self._record('createTables', count, start)
+
+    def drop_tables(self, db, table_name, count):
+        """
+        Drop tables created by create_tables()
+        """
+        self.logger.debug("dropping %d tables for %s.%s", count, db, table_name)
+        start = time.monotonic()
+        self._map(lambda client, i: client.drop_table(db, '{}_{}'.format(table_name, i)), range(count))
+        self._record('dropTables', count, start)
+
+    def create_partitioned_table(self, db, table_name, owner, count, layout=None):
+        """
+        Create table with count partitions.
+        By default it is partitioned by date with partitions d0 ... d<count-1>.
+
+        :param db: database name
+        :param table_name: table name
+        :param owner: table owner
+        :param count: number of partitions
+        :type count: int
+        :param layout: partitioning with several keys
+        :type layout: PartitionLayout
+        :return: created table
+        :rtype: Table
+        """
+        self.logger.debug("creating table %s.%s", db, table_name)
+        table = TableBuilder(db, table_name) \
+            .set_owner(owner) \
+            .set_columns(HMSClient.make_schema(['name'])) \
+            .set_partition_keys(HMSClient.make_schema(layout.keys if layout else ['date'])) \
+            .build()
+        self.__client.create_table(table)
+        tbl = self.__client.get_table(db, table_name)
+        if layout:
+            values = (layout.values(i) for i in range(count))
+        else:
+            values = (['d' + str(i)] for i in range(count))
+        self.add_partitions(tbl, values, count)
+        return tbl
+
+    def add_partitions(self, table, values, count):
+        """
+        Add partitions in batches
+
+        :param table: table as returned by get_table()
+        :type table: Table
+        :param values: iterable with values of every partition
+        :param count: number of partitions
+        :type count: int
+        """
+        self.logger.debug("creating %d partitions for table %s.%s", count, table.dbName, table.tableName)
+        start = time.monotonic()
+
+        def add(client, batch):
+            # Partitions are built by the worker so only batches in flight are kept in memory
+            client.add_partitions_req(table.dbName, table.tableName, HMSClient.make_partitions(table, batch))
+
+        self._map(add, chunks(values, self.__batch_size))
+        self._record('addPartitions', count, start)
+
+    def acquire(self, name, create, drop, read_only=True):
+        """
+        Get named fixture, creating it if needed
+
+        :param name: fixture name, all read-only fixtures with the same name are the same object
+        :type name: str
+        :param create: function(name) creating the fixture and returning its value
+        :param drop: function(name) dropping the fixture
+        :param read_only: True if the caller does not modify the fixture, so it can be shared
+        :return: fixture value
+        """
+        fixture = self.__fixtures.get(name)
+        if fixture:
+            if not (read_only and fixture.shared):
+                raise ValueError('fixture {} is already in use'.format(name))
+            fixture.refs += 1
+            self.logger.debug('reusing fixture %s, %d references', name, fixture.refs)
+            return fixture.value
+        fixture = _Fixture(create(name), drop, read_only)
+        self.__fixtures[name] = fixture
+        return fixture.value
+
+    def release(self, name):
+        """
+        Release fixture acquired with acquire(), read-write fixtures are dropped
+
+        :param name: fixture name
+        :type name: str
+        """
+        fixture = self.__fixtures[name]
+        fixture.refs -= 1
+        if not fixture.shared and not fixture.refs:
+            del self.__fixtures[name]
+            fixture.drop(name)
+
+    def teardown(self):
+        """
+        Drop all fixtures, called at the end of the suite
+        """
+        for name in sorted(self.__fixtures.keys()):
+            fixture = self.__fixtures.pop(name)
+            if fixture.refs:
+                self.logger.warning('dropping fixture %s with %d references', name, fixture.refs)
+            fixture.drop(name)
+
+    def acquire_partitioned_table(self, db, table_name, owner, count, read_only=True, layout=None):
+        """
+        Get table with count partitions, see create_partitioned_table().
+        Shared tables are named <table_name>_p<count> or <table_name>_<layout name><count>,
+        read-write ones are named table_name.
+
+        :return: (fixture name, table), the table should be released with release(fixture name).
+            The name is the one requested, HMS may return the table name in lower case.
+        :rtype: tuple
+        """
+        if read_only:
+            name = '{}_{}{}'.format(table_name, layout.name if layout else 'p', count)
+        else:
+            name = table_name
+        table = self.acquire(name,
+                             lambda n: self.create_partitioned_table(db, n, owner, count, layout),
+                             lambda n: self.drop_table(db, n),
+                             read_only)
+        return name, table
+
+    def drop_table(self, db, table_name):
+        self.logger.debug("dropping table %s.%s", db, table_name)
+        start = time.monotonic()
+        self.__client.drop_table(db, table_name)
+        self._record('dropTable', 1, start)
+
+    def print_setup(self, file):
+        """
+        Print setup throughput
+
+        :param file: output file
+        """
+        file.write('{:30s}{:10s} {:10s} {:10s}\n'.format('Setup', 'Objects', 'Seconds', 'Objects/s'))
+        for operation, count, elapsed in self.__setup:
+            file.write('{:30s}{:<10d} {:<10.3g} {:<10.1f}\n'
+                       .format(operation, count, elapsed, count / elapsed if elapsed else 0.0))
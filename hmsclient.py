@@ -15,6 +15,12 @@
 
 import copy
 import logging
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from getpass import getuser
 from os import environ
 
 from thrift.protocol import TBinaryProtocol
@@ -22,12 +28,46 @@ from thrift.transport import TSocket, TTransport
 
 from hive_metastore import ThriftHiveMetastore
 from hive_metastore.ttypes import Database, Table, FieldSchema, Partition, \
-    DropPartitionsRequest, RequestPartsSpec
+    DropPartitionsRequest, RequestPartsSpec, DropPartitionsExpr, AddPartitionsRequest, PartitionsByExprRequest, \
+    NotificationEventRequest, ColumnStatistics, ColumnStatisticsDesc, SetPartitionsStatsRequest, \
+    PartitionsStatsRequest, OpenTxnRequest, CommitTxnRequest, AbortTxnRequest, LockRequest, LockComponent, LockLevel, \
+    CheckLockRequest, UnlockRequest, HeartbeatRequest, HeartbeatTxnRangeRequest
+
+try:
+    import queue
+except ImportError:
+    # noinspection PyUnresolvedReferences,PyPep8Naming
+    import Queue as queue
+
+from distributionstatistics import Statistics
+from instrumentation import CountingTransport, InstrumentedClient
 
 SIMPLE_SERDE = 'org.apache.hadoop.hive.serde2.lazy.LazySimpleSerDe'
 INPUT_FORMAT = 'org.apache.hadoop.mapred.TextInputFormat'
 OUTPUT_FORMAT = 'org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat'
 DEFAULT_PORT = 9083
+DEFAULT_POOL_SIZE = 8
+# Number of partitions per column statistics request
+DEFAULT_STATS_CHUNK_SIZE = 500
+
+
+def chunks(items, size):
+    """
+    Split sequence into lists of at most size elements
+
+    :param items: iterable
+    :param size: chunk size
+    :type size: int
+    :return: generator of lists
+    """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
 
 class HMSClient(object):
@@ -35,7 +75,13 @@ class HMSClient(object):
     __transport = None
     __isOpened = False
 
-    def __init__(self, host, port):
+    def __init__(self, host, port, interceptors=None):
+        """
+        :param host: HMS host, may include port as host:port
+        :param port: HMS port
+        :param interceptors: interceptors called after every Thrift call
+        :type interceptors: list[Interceptor]
+        """
         self.logger = logging.getLogger(__name__)
 
         if not host:
@@ -55,9 +101,13 @@ class HMSClient(object):
         if not port:
             port = DEFAULT_PORT
 
-        self.__transport = TTransport.TBufferedTransport(TSocket.TSocket(host, int(port)))
+        self.__host = host
+        self.__port = int(port)
+        self.__transport = CountingTransport(TTransport.TBufferedTransport(TSocket.TSocket(host, int(port))))
         protocol = TBinaryProtocol.TBinaryProtocol(self.__transport)
-        self.__client = ThriftHiveMetastore.Client(protocol)
+        self.__interceptors = list(interceptors) if interceptors else []
+        self.__client = InstrumentedClient(ThriftHiveMetastore.Client(protocol), self.__transport,
+                                           self.__interceptors)
 
     def open(self):
         self.__transport.open()
@@ -71,15 +121,91 @@ class HMSClient(object):
     def close(self):
         self.__transport.close()
 
+    def reconnect(self):
+        """
+        Replace the connection with a new one, e.g. in a forked child process
+        that should not share the socket with its parent
+        """
+        self.close()
+        return self.open()
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
+    @property
+    def host(self):
+        return self.__host
+
+    @property
+    def port(self):
+        return self.__port
+
+    @property
+    def interceptors(self):
+        return self.__interceptors
+
+    def add_interceptor(self, interceptor):
+        """
+        :param interceptor: interceptor called after every following Thrift call
+        :type interceptor: Interceptor
+        """
+        self.__interceptors.append(interceptor)
+
+    @property
+    def bytes_written(self):
+        """
+        :return: total number of bytes sent to the server
+        """
+        return self.__transport.bytes_written
+
+    @property
+    def bytes_read(self):
+        """
+        :return: total number of bytes received from the server
+        """
+        return self.__transport.bytes_read
+
+    def call(self, method, *args, **kwargs):
+        """
+        Call Thrift API by name
+
+        :param method: Thrift method name, e.g. 'get_table'
+        :type method: str
+        :return: whatever the Thrift method returns
+        :raises AttributeError: if there is no such method
+        """
+        if method.startswith('_'):
+            raise AttributeError('Not a Thrift API: {}'.format(method))
+        return getattr(self.__client, method)(*args, **kwargs)
+
     def get_all_databases(self):
         return self.__client.get_all_databases()
 
     def get_all_tables(self, db_name):
         return self.__client.get_all_tables(db_name=db_name)
 
+    def get_tables(self, db_name, pattern):
+        """
+        :param pattern: Hive pattern, '*' matches any characters and '|' separates alternatives
+        :return: names of tables in the database matching the pattern
+        """
+        return self.__client.get_tables(db_name, pattern)
+
+    def get_table_meta(self, db_patterns, tbl_patterns, tbl_types=None):
+        """
+        Find tables in all databases with a single call
+
+        :param db_patterns: Hive pattern for database names
+        :param tbl_patterns: Hive pattern for table names
+        :param tbl_types: table types to return, all types by default
+        :type tbl_types: list[str]
+        :rtype: list[TableMeta]
+        """
+        return self.__client.get_table_meta(db_patterns, tbl_patterns, tbl_types)
+
+    def get_database(self, db_name):
+        return self.__client.get_database(db_name)
+
     def create_database(self, db_name, comment=None, owner=None):
         """
         Create database
@@ -200,6 +326,32 @@ class HMSClient(object):
 
         return Partition(values=values, dbName=table.dbName, tableName=table.tableName, sd=sd)
 
+    @staticmethod
+    def make_partitions(table, values_list):
+        """
+        Make many partitions cheaply.
+
+        Unlike make_partition() partitions share columns, serde info and other
+        nested objects of the table storage descriptor, so they should not be modified.
+
+        :param table:
+        :type table: Table
+        :param values_list: values for each partition
+        :type values_list: list[list[str]]
+        :return: partitions
+        :rtype: list[Partition]
+        """
+        partition_names = [k.name for k in table.partitionKeys]
+        location = table.sd.location
+        partitions = []
+        for values in values_list:
+            if len(partition_names) != len(values):
+                raise ValueError('Partition values do not match table schema')
+            sd = copy.copy(table.sd)
+            sd.location = location + '/' + '/'.join(k + '=' + v for k, v in zip(partition_names, values))
+            partitions.append(Partition(values=values, dbName=table.dbName, tableName=table.tableName, sd=sd))
+        return partitions
+
     def add_partition(self, table, values):
         """
         Add partition
@@ -214,9 +366,94 @@ class HMSClient(object):
     def add_partitions(self, partitions):
         self.__client.add_partitions(partitions)
 
+    def add_partitions_req(self, db_name, table_name, partitions, if_not_exists=False, need_result=False):
+        """
+        Add partitions using AddPartitionsRequest
+
+        :param db_name: Database name
+        :type db_name: str
+        :param table_name: Table name
+        :type table_name: str
+        :param partitions: partitions to add
+        :type partitions: list[Partition]
+        :param if_not_exists: If true, existing partitions are skipped instead of failing the request
+        :param need_result: If true, return added partitions
+        :return: added partitions if need_result is set
+        :rtype: list[Partition]
+        """
+        result = self.__client.add_partitions_req(AddPartitionsRequest(db_name, table_name, partitions,
+                                                                       if_not_exists, need_result))
+        return result.partitions if need_result else None
+
     def get_partitions(self, db_name, table_name, count=-1):
         return self.__client.get_partitions(db_name, table_name, count)
 
+    def get_partitions_by_names(self, db_name, table_name, names):
+        return self.__client.get_partitions_by_names(db_name, table_name, names)
+
+    def get_partitions_by_filter(self, db_name, table_name, filter_expr, count=-1):
+        """
+        Get partitions matching filter
+
+        :param db_name: Database name
+        :type db_name: str
+        :param table_name: Table name
+        :type table_name: str
+        :param filter_expr: filter on partition keys, e.g. "date < '2020-01-01' and region = 'us'"
+        :type filter_expr: str
+        :param count: maximum number of partitions to return, -1 means all
+        :return: matching partitions
+        :rtype: list[Partition]
+        """
+        return self.__client.get_partitions_by_filter(db_name, table_name, filter_expr, count)
+
+    def get_part_specs_by_filter(self, db_name, table_name, filter_expr, count=-1):
+        """
+        Get partitions matching filter as partition specs. Partitions stored under the table
+        location share one storage descriptor, so the response is much smaller than
+        get_partitions_by_filter() when only partition values are needed.
+
+        :param db_name: Database name
+        :type db_name: str
+        :param table_name: Table name
+        :type table_name: str
+        :param filter_expr: filter on partition keys, see get_partitions_by_filter()
+        :type filter_expr: str
+        :param count: maximum number of partitions to return, -1 means all
+        :return: matching partitions
+        :rtype: list[PartitionSpec]
+        """
+        specs = self.__client.get_part_specs_by_filter(db_name, table_name, filter_expr, count)
+        return specs if specs else []
+
+    def get_num_partitions_by_filter(self, db_name, table_name, filter_expr):
+        """
+        Count partitions matching filter, see get_partitions_by_filter()
+
+        :return: number of matching partitions
+        :rtype: int
+        """
+        return self.__client.get_num_partitions_by_filter(db_name, table_name, filter_expr)
+
+    def get_partitions_by_expr(self, db_name, table_name, expr, default_partition_name=None, count=-1):
+        """
+        Get partitions matching expression
+
+        :param db_name: Database name
+        :type db_name: str
+        :param table_name: Table name
+        :type table_name: str
+        :param expr: Hive expression serialized by the Hive client (Kryo), this client can't build it
+        :type expr: bytes
+        :param default_partition_name: name used for NULL partition values
+        :param count: maximum number of partitions to return, -1 means all
+        :return: matching partitions
+        :rtype: list[Partition]
+        """
+        result = self.__client.get_partitions_by_expr(PartitionsByExprRequest(db_name, table_name, expr,
+                                                                              default_partition_name, count))
+        return result.partitions
+
     def drop_partition(self, db_name, table_name, values):
         self.__client.drop_partition(db_name, table_name, values, True)
 
@@ -224,9 +461,9 @@ class HMSClient(object):
         partitions = self.__client.get_partition_names(db_name, table_name, count)
         return partitions if partitions else []
 
-    def drop_partitions(self, db_name, table_name, names, need_result=None):
+    def drop_partitions(self, db_name, table_name, names, need_result=None, delete_data=None):
         """
-        Drop specified partitions from the table
+        Drop specified partitions from the table, names that do not exist are ignored
 
         :param db_name: Database name
         :type db_name: str
@@ -235,18 +472,600 @@ class HMSClient(object):
         :param names: Partition names
         :type names: list[str]
         :param need_result: If true, return drop results
+        :param delete_data: If true, delete partition data as well
         :return: drop results
         """
         if not names:
             return None
-        return self.__client.drop_partitions_req(DropPartitionsRequest(db_name, table_name,
-                                                                       RequestPartsSpec(names), need_result))
+        return self.__client.drop_partitions_req(
+            DropPartitionsRequest(db_name, table_name, RequestPartsSpec(names=names), deleteData=delete_data,
+                                  needResult=bool(need_result)))
+
+    def drop_partitions_by_expr(self, db_name, table_name, expr, need_result=None, delete_data=None):
+        """
+        Drop partitions matching expression in a single call
+
+        :param db_name: Database name
+        :type db_name: str
+        :param table_name: Table name
+        :type table_name: str
+        :param expr: Hive expression serialized by the Hive client (Kryo), see get_partitions_by_expr()
+        :type expr: bytes
+        :param need_result: If true, return drop results
+        :param delete_data: If true, delete partition data as well
+        :return: drop results
+        """
+        return self.__client.drop_partitions_req(
+            DropPartitionsRequest(db_name, table_name, RequestPartsSpec(exprs=[DropPartitionsExpr(expr)]),
+                                  deleteData=delete_data, needResult=bool(need_result)))
 
     def drop_all_partitions(self, db_name, table_name, need_result=None):
         return self.drop_partitions(db_name, table_name,
                                     self.get_partition_names(db_name, table_name),
                                     need_result)
 
+    @staticmethod
+    def make_partition_column_statistics(db_name, table_name, part_name, stats):
+        """
+        Make column statistics for a partition
+
+        :param db_name: Database name
+        :param table_name: Table name
+        :param part_name: Partition name, e.g. 'date=2020-01-01'
+        :param stats: statistics of every column
+        :type stats: list[ColumnStatisticsObj]
+        :rtype: ColumnStatistics
+        """
+        return ColumnStatistics(ColumnStatisticsDesc(False, db_name, table_name, part_name), stats)
+
+    def update_partition_column_statistics(self, stats):
+        """
+        Update column statistics of one partition
+
+        :param stats: statistics, see make_partition_column_statistics()
+        :type stats: ColumnStatistics
+        """
+        return self.__client.update_partition_column_statistics(stats)
+
+    def _set_aggr_stats(self, stats):
+        return self.__client.set_aggr_stats_for(SetPartitionsStatsRequest(stats))
+
+    def set_partitions_column_statistics(self, stats, chunk_size=DEFAULT_STATS_CHUNK_SIZE, pool=None):
+        """
+        Update column statistics of many partitions with set_aggr_stats_for.
+        Statistics are sent in chunks, concurrently if a pool is given.
+
+        :param stats: statistics of every partition, see make_partition_column_statistics()
+        :type stats: list[ColumnStatistics]
+        :param chunk_size: number of partitions per request
+        :type chunk_size: int
+        :param pool: connection pool for concurrent requests
+        :type pool: HMSClientPool
+        :return: number of requests sent
+        :rtype: int
+        """
+        parts = list(chunks(stats, chunk_size))
+        if pool:
+            pool.map(lambda client, chunk: client._set_aggr_stats(chunk), parts)
+        else:
+            for chunk in parts:
+                self._set_aggr_stats(chunk)
+        return len(parts)
+
+    def _get_partitions_stats(self, db_name, table_name, col_names, part_names):
+        request = PartitionsStatsRequest(db_name, table_name, col_names, part_names)
+        return self.__client.get_partitions_statistics_req(request).partStats
+
+    def get_partitions_column_statistics(self, db_name, table_name, col_names, part_names,
+                                         chunk_size=DEFAULT_STATS_CHUNK_SIZE, pool=None):
+        """
+        Get column statistics of many partitions.
+        Partitions are requested in chunks, concurrently if a pool is given.
+
+        :param db_name: Database name
+        :param table_name: Table name
+        :param col_names: column names
+        :type col_names: list[str]
+        :param part_names: partition names
+        :type part_names: list[str]
+        :param chunk_size: number of partitions per request
+        :param pool: connection pool for concurrent requests
+        :type pool: HMSClientPool
+        :return: maps partition name to statistics of its columns
+        :rtype: dict[str, list[ColumnStatisticsObj]]
+        """
+        parts = list(chunks(part_names, chunk_size))
+        if pool:
+            results = pool.map(lambda client, chunk: client._get_partitions_stats(db_name, table_name,
+                                                                                  col_names, chunk), parts)
+        else:
+            results = [self._get_partitions_stats(db_name, table_name, col_names, chunk) for chunk in parts]
+        stats = {}
+        for r in results:
+            stats.update(r)
+        return stats
+
+    def get_aggr_column_statistics(self, db_name, table_name, col_names, part_names):
+        """
+        Get column statistics aggregated over partitions.
+        This is a single request: aggregates like the number of distinct values
+        can't be combined from chunks on the client.
+
+        :param db_name: Database name
+        :param table_name: Table name
+        :param col_names: column names
+        :type col_names: list[str]
+        :param part_names: partition names
+        :type part_names: list[str]
+        :rtype: AggrStats
+        """
+        return self.__client.get_aggr_stats_for(PartitionsStatsRequest(db_name, table_name, col_names, part_names))
+
+    def open_txns(self, count=1, user=None, hostname=None):
+        """
+        Open transactions
+
+        :param count: number of transactions to open
+        :type count: int
+        :param user: user name, current user by default
+        :param hostname: client host name, this host by default
+        :return: transaction ids
+        :rtype: list[int]
+        """
+        request = OpenTxnRequest(count, user or getuser(), hostname or socket.gethostname())
+        return self.__client.open_txns(request).txn_ids
+
+    def commit_txn(self, txn_id):
+        self.__client.commit_txn(CommitTxnRequest(txn_id))
+
+    def abort_txn(self, txn_id):
+        self.__client.abort_txn(AbortTxnRequest(txn_id))
+
+    @staticmethod
+    def make_lock_component(lock_type, db_name, table_name=None, partition_name=None):
+        """
+        Make lock component, the lock level follows from the most specific object given
+
+        :param lock_type: LockType value, e.g. LockType.SHARED_READ
+        :param db_name: Database name
+        :param table_name: Table name
+        :param partition_name: Partition name, e.g. 'date=2020-01-01'
+        :rtype: LockComponent
+        """
+        if partition_name:
+            level = LockLevel.PARTITION
+        elif table_name:
+            level = LockLevel.TABLE
+        else:
+            level = LockLevel.DB
+        return LockComponent(lock_type, level, db_name, table_name, partition_name)
+
+    def lock(self, components, txn_id=None, user=None, hostname=None):
+        """
+        Request locks
+
+        :param components: objects to lock, see make_lock_component()
+        :type components: list[LockComponent]
+        :param txn_id: transaction holding the locks, None for locks outside of transactions
+        :param user: user name, current user by default
+        :param hostname: client host name, this host by default
+        :return: lock id and state; WAITING locks should be polled with check_lock()
+        :rtype: LockResponse
+        """
+        return self.__client.lock(LockRequest(components, txn_id, user or getuser(), hostname or socket.gethostname()))
+
+    def check_lock(self, lock_id):
+        """
+        :return: current lock state
+        :rtype: LockResponse
+        """
+        return self.__client.check_lock(CheckLockRequest(lock_id))
+
+    def unlock(self, lock_id):
+        self.__client.unlock(UnlockRequest(lock_id))
+
+    def heartbeat(self, txn_id=None, lock_id=None):
+        """
+        Heartbeat transaction or lock, so HMS does not time them out
+        """
+        self.__client.heartbeat(HeartbeatRequest(lock_id, txn_id))
+
+    def heartbeat_txn_range(self, min_txn_id, max_txn_id):
+        """
+        Heartbeat all open transactions with ids in the range, both ends included
+
+        :return: ids of aborted and unknown transactions in the range
+        :rtype: HeartbeatTxnRangeResponse
+        """
+        return self.__client.heartbeat_txn_range(HeartbeatTxnRangeRequest(min_txn_id, max_txn_id))
+
+    def heartbeat_manager(self, interval=None, max_gap=0, on_lost=None):
+        """
+        Create background heartbeat manager using its own connection to the same server
+
+        :return: started manager, see HeartbeatManager
+        :rtype: HeartbeatManager
+        """
+        return HeartbeatManager(self.__host, self.__port, interval, max_gap, on_lost).start()
+
     def get_current_notification_id(self):
         return self.__client.get_current_notificationEventId().eventId
 
+    def get_next_notification(self, last_event, max_events=None):
+        """
+        Get notification events following the given one
+
+        :param last_event: id of the last event already seen
+        :type last_event: int
+        :param max_events: maximum number of events to return, all by default
+        :type max_events: int
+        :return: events ordered by id
+        :rtype: list[NotificationEvent]
+        """
+        response = self.__client.get_next_notification(NotificationEventRequest(last_event, max_events))
+        return response.events if response.events else []
+
+
+class HMSClientPool(object):
+    """
+    Pool of HMS connections for concurrent calls.
+
+    Thrift clients are not thread-safe, so every task borrows a connection
+    for its whole duration. Connections are opened on demand and kept until the pool is closed.
+    Connections that fail with transport errors are discarded.
+    """
+
+    def __init__(self, host, port, size=DEFAULT_POOL_SIZE, interceptors=None):
+        """
+        :param host: HMS host
+        :param port: HMS port
+        :param size: maximum number of concurrent connections
+        :type size: int
+        :param interceptors: interceptors for every pooled connection
+        :type interceptors: list[Interceptor]
+        """
+        self.__host = host
+        self.__port = port
+        self.__size = size
+        self.__interceptors = interceptors
+        self.__idle = queue.LifoQueue()
+        self.__slots = threading.BoundedSemaphore(size)
+        self.__executor = None
+        self.__lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def size(self):
+        return self.__size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        with self.__lock:
+            if self.__executor:
+                self.__executor.shutdown()
+                self.__executor = None
+        while True:
+            try:
+                self.__idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def after_fork(self):
+        """
+        Reset the pool in a forked child process. Pool threads do not exist in the child
+        and idle connections belong to the parent, so both are dropped without shutting them down.
+        """
+        idle = self.__idle
+        self.__idle = queue.LifoQueue()
+        self.__slots = threading.BoundedSemaphore(self.__size)
+        self.__executor = None
+        self.__lock = threading.Lock()
+        while True:
+            try:
+                # Closes only the child's copy of the socket
+                idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    @contextmanager
+    def client(self):
+        """
+        Borrow connection from the pool, blocks while all connections are busy
+
+        :rtype: HMSClient
+        """
+        self.__slots.acquire()
+        try:
+            try:
+                client = self.__idle.get_nowait()
+            except queue.Empty:
+                client = HMSClient(self.__host, self.__port, self.__interceptors).open()
+            try:
+                yield client
+            except TTransport.TTransportException:
+                self.logger.debug('discarding broken connection')
+                client.close()
+                raise
+            except Exception:
+                # Application errors such as NoSuchObjectException leave the connection usable
+                self.__idle.put(client)
+                raise
+            else:
+                self.__idle.put(client)
+        finally:
+            self.__slots.release()
+
+    def _run(self, fn, args):
+        with self.client() as client:
+            return fn(client, *args)
+
+    def submit(self, fn, *args):
+        """
+        Call fn(client, *args) on a pool thread with a borrowed connection
+
+        :return: future with the call result
+        :rtype: concurrent.futures.Future
+        """
+        with self.__lock:
+            if not self.__executor:
+                self.__executor = ThreadPoolExecutor(self.__size)
+            executor = self.__executor
+        return executor.submit(self._run, fn, args)
+
+    def map(self, fn, items):
+        """
+        Call fn(client, item) concurrently for every item
+
+        :return: results in the order of items
+        :rtype: list
+        :raises: the first exception raised by any call, after all calls complete
+        """
+        futures = [self.submit(fn, item) for item in items]
+        errors = [f.exception() for f in futures]
+        for e in errors:
+            if e is not None:
+                raise e
+        return [f.result() for f in futures]
+
+
+class HeartbeatManager(object):
+    """
+    Keep many open transactions alive with few heartbeat calls.
+
+    A background thread heartbeats all tracked transactions every interval seconds.
+    Tracked ids are sorted and coalesced into ranges, one heartbeat_txn_range call per range,
+    so transactions opened together with open_txns(count) take a single call.
+
+    heartbeat_txn_range heartbeats every open transaction in the range, including
+    transactions of other clients. By default only contiguous ids are coalesced;
+    a larger max_gap means fewer calls but may keep foreign transactions alive.
+
+    Transactions reported as aborted or unknown by the server stop being tracked
+    and are passed to the on_lost callback.
+    """
+
+    # Default Hive transaction timeout is 300 seconds
+    DEFAULT_INTERVAL = 60.0
+
+    def __init__(self, host, port, interval=None, max_gap=0, on_lost=None):
+        """
+        :param host: HMS host
+        :param port: HMS port
+        :param interval: seconds between heartbeats, DEFAULT_INTERVAL by default
+        :type interval: float
+        :param max_gap: number of untracked ids allowed inside one range
+        :type max_gap: int
+        :param on_lost: function(aborted, missing) called from the heartbeat thread with sets
+            of transaction ids that the server aborted or does not know
+        """
+        self.__host = host
+        self.__port = port
+        self.__interval = interval if interval else self.DEFAULT_INTERVAL
+        self.__max_gap = max_gap
+        self.__on_lost = on_lost
+        self.__client = None
+        # Maps transaction id to the time of its last successful heartbeat
+        self.__txns = {}
+        self.__aborted = set()
+        self.__missing = set()
+        self.__lag = Statistics()
+        self.__latency = Statistics()
+        self.__calls = 0
+        self.__errors = 0
+        self.__lock = threading.Lock()
+        self.__stopped = threading.Event()
+        self.__thread = None
+        self.logger = logging.getLogger(__name__)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        """
+        Start heartbeating in the background
+
+        :return: self
+        """
+        if not self.__thread:
+            self.__stopped.clear()
+            self.__thread = threading.Thread(target=self._run, name='txn-heartbeat')
+            self.__thread.daemon = True
+            self.__thread.start()
+        return self
+
+    def close(self):
+        """
+        Stop heartbeating, tracked transactions are left open
+        """
+        self.__stopped.set()
+        if self.__thread:
+            self.__thread.join()
+            self.__thread = None
+        if self.__client:
+            self.__client.close()
+            self.__client = None
+
+    def add(self, *txn_ids):
+        """
+        Start tracking transactions
+        """
+        now = time.monotonic()
+        with self.__lock:
+            for txn_id in txn_ids:
+                self.__txns.setdefault(txn_id, now)
+
+    def remove(self, *txn_ids):
+        """
+        Stop tracking transactions, e.g. after commit or abort
+        """
+        with self.__lock:
+            for txn_id in txn_ids:
+                self.__txns.pop(txn_id, None)
+
+    @property
+    def txns(self):
+        """
+        :return: ids of tracked transactions
+        :rtype: list[int]
+        """
+        with self.__lock:
+            return sorted(self.__txns.keys())
+
+    @property
+    def aborted(self):
+        """
+        :return: ids of tracked transactions reported as aborted
+        :rtype: set
+        """
+        with self.__lock:
+            return set(self.__aborted)
+
+    @property
+    def missing(self):
+        """
+        :return: ids of tracked transactions unknown to the server
+        :rtype: set
+        """
+        with self.__lock:
+            return set(self.__missing)
+
+    @property
+    def lag(self):
+        """
+        :return: for every heartbeat round, seconds since the least recently heartbeated transaction
+            was heartbeated before. It should stay close to the interval and well below the server timeout.
+        :rtype: Statistics
+        """
+        return self.__lag
+
+    @property
+    def latency(self):
+        """
+        :return: time of every heartbeat_txn_range call
+        :rtype: Statistics
+        """
+        return self.__latency
+
+    @property
+    def calls(self):
+        """
+        :return: number of heartbeat_txn_range calls made
+        :rtype: int
+        """
+        with self.__lock:
+            return self.__calls
+
+    @property
+    def errors(self):
+        """
+        :return: number of failed heartbeat calls
+        :rtype: int
+        """
+        with self.__lock:
+            return self.__errors
+
+    @staticmethod
+    def ranges(txn_ids, max_gap=0):
+        """
+        Coalesce ids into ranges
+
+        :param txn_ids: sorted transaction ids
+        :param max_gap: number of missing ids allowed inside one range
+        :return: list of (first, last) tuples, both ends included
+        """
+        ranges = []
+        for txn_id in txn_ids:
+            if ranges and txn_id - ranges[-1][1] <= max_gap + 1:
+                ranges[-1][1] = txn_id
+            else:
+                ranges.append([txn_id, txn_id])
+        return [tuple(r) for r in ranges]
+
+    def _failed(self):
+        with self.__lock:
+            self.__errors += 1
+
+    def _run(self):
+        while not self.__stopped.wait(self.__interval):
+            try:
+                self.heartbeat()
+            except Exception:
+                # Keep the thread alive, otherwise all tracked transactions time out
+                self._failed()
+                self.logger.exception('heartbeat round failed')
+
+    def heartbeat(self):
+        """
+        Heartbeat all tracked transactions now, normally called by the background thread
+        """
+        with self.__lock:
+            txns = dict(self.__txns)
+        if not txns:
+            return
+        self.__lag.add(time.monotonic() - min(txns.values()))
+        aborted = set()
+        missing = set()
+        for first, last in self.ranges(sorted(txns.keys()), self.__max_gap):
+            start = time.monotonic()
+            try:
+                # Connect lazily, and reconnect after a transport error for the remaining ranges
+                if not self.__client:
+                    self.__client = HMSClient(self.__host, self.__port).open()
+                response = self.__client.heartbeat_txn_range(first, last)
+            except TTransport.TTransportException:
+                self._failed()
+                self.logger.exception('failed to heartbeat transactions %d-%d, reconnecting', first, last)
+                if self.__client:
+                    self.__client.close()
+                    self.__client = None
+                continue
+            except Exception:
+                self._failed()
+                self.logger.exception('failed to heartbeat transactions %d-%d', first, last)
+                continue
+            now = time.monotonic()
+            self.__latency.add(now - start)
+            # Ranges may include transactions of other clients
+            aborted.update(t for t in (response.aborted or ()) if t in txns)
+            missing.update(t for t in (response.nosuch or ()) if t in txns)
+            with self.__lock:
+                self.__calls += 1
+                for txn_id in range(first, last + 1):
+                    if txn_id in self.__txns:
+                        self.__txns[txn_id] = now
+        if aborted or missing:
+            self.logger.warning('lost transactions: aborted %s, missing %s', sorted(aborted), sorted(missing))
+            self.remove(*(aborted | missing))
+            with self.__lock:
+                self.__aborted.update(aborted)
+                self.__missing.update(missing)
+            if self.__on_lost:
+                self.__on_lost(aborted, missing)
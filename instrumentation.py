@@ -0,0 +1,266 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Per-RPC instrumentation of HMS clients.
+
+Every Thrift call made through an HMSClient with interceptors produces a CallRecord
+that is passed to each interceptor. MethodStats aggregates records per method,
+SlowCallLog logs calls slower than a threshold.
+"""
+
+import collections
+import logging
+import threading
+import time
+
+from thrift.transport.TTransport import TTransportBase
+
+from distributionstatistics import Histogram
+
+
+class CountingTransport(TTransportBase):
+    """
+    Transport wrapper counting bytes passed between the protocol and the underlying transport
+    """
+
+    def __init__(self, transport):
+        self.__transport = transport
+        self.bytes_written = 0
+        self.bytes_read = 0
+
+    def isOpen(self):
+        return self.__transport.isOpen()
+
+    def open(self):
+        return self.__transport.open()
+
+    def close(self):
+        return self.__transport.close()
+
+    def read(self, sz):
+        data = self.__transport.read(sz)
+        self.bytes_read += len(data)
+        return data
+
+    def write(self, buf):
+        self.bytes_written += len(buf)
+        self.__transport.write(buf)
+
+    def flush(self):
+        self.__transport.flush()
+
+
+class CallRecord(object):
+    """
+    Single Thrift call
+    """
+    __slots__ = ('method', 'start', 'wall', 'cpu', 'request_bytes', 'response_bytes', 'error')
+
+    def __init__(self, method, start, wall, cpu, request_bytes, response_bytes, error):
+        """
+        :param method: Thrift method name
+        :param start: wall clock time of the call start, seconds since epoch
+        :param wall: elapsed time in seconds
+        :param cpu: client CPU time of the calling thread in seconds
+        :param request_bytes: serialized request size
+        :param response_bytes: serialized response size
+        :param error: exception raised by the call or None
+        """
+        self.method = method
+        self.start = start
+        self.wall = wall
+        self.cpu = cpu
+        self.request_bytes = request_bytes
+        self.response_bytes = response_bytes
+        self.error = error
+
+
+class Interceptor(object):
+    """
+    Base class for call interceptors.
+
+    on_call() runs on the calling thread right after every call, so it should be fast
+    and thread-safe when shared between clients.
+    """
+
+    def on_call(self, record):
+        """
+        :param record: completed call
+        :type record: CallRecord
+        """
+        pass
+
+
+class InstrumentedClient(object):
+    """
+    Proxy for Thrift client that reports every call to interceptors
+    """
+
+    def __init__(self, client, transport, interceptors):
+        """
+        :param client: Thrift client
+        :param transport: transport the client protocol writes to
+        :type transport: CountingTransport
+        :param interceptors: list of interceptors, may change later
+        :type interceptors: list[Interceptor]
+        """
+        self.__client = client
+        self.__transport = transport
+        self.__interceptors = interceptors
+
+    def __getattr__(self, name):
+        method = getattr(self.__client, name)
+        if not self.__interceptors or name.startswith('_') or not callable(method):
+            return method
+        return lambda *args, **kwargs: self._call(name, method, args, kwargs)
+
+    def _call(self, name, method, args, kwargs):
+        transport = self.__transport
+        written, read = transport.bytes_written, transport.bytes_read
+        start = time.time()
+        wall_start = time.monotonic()
+        cpu_start = time.thread_time()
+        error = None
+        try:
+            return method(*args, **kwargs)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            record = CallRecord(name, start, time.monotonic() - wall_start, time.thread_time() - cpu_start,
+                                transport.bytes_written - written, transport.bytes_read - read, error)
+            for interceptor in self.__interceptors:
+                interceptor.on_call(record)
+
+
+class _MethodSummary(object):
+    def __init__(self):
+        self.latency = Histogram()
+        self.cpu = 0.0
+        self.errors = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+    def add(self, record):
+        self.latency.add(record.wall)
+        self.cpu += record.cpu
+        self.request_bytes += record.request_bytes
+        self.response_bytes += record.response_bytes
+        if record.error is not None:
+            self.errors += 1
+
+
+class MethodStats(Interceptor):
+    """
+    Aggregate calls per method: latency histogram, CPU time, bytes and errors.
+    Memory use depends only on the number of methods, not calls.
+    """
+
+    def __init__(self):
+        self.__methods = {}
+        self.__lock = threading.Lock()
+
+    def on_call(self, record):
+        with self.__lock:
+            summary = self.__methods.get(record.method)
+            if summary is None:
+                summary = self.__methods[record.method] = _MethodSummary()
+            summary.add(record)
+
+    def methods(self):
+        """
+        :return: names of called methods
+        :rtype: list[str]
+        """
+        with self.__lock:
+            return sorted(self.__methods.keys())
+
+    def latency(self, method):
+        """
+        :return: latency histogram of the method in seconds
+        :rtype: Histogram
+        """
+        with self.__lock:
+            return Histogram().merge(self.__methods[method].latency)
+
+    def snapshot(self):
+        """
+        :return: maps method name to dict with count, errors, cpu, request_bytes,
+            response_bytes and latency (Histogram.to_dict())
+        :rtype: dict
+        """
+        with self.__lock:
+            return {name: {'count': s.latency.count,
+                           'errors': s.errors,
+                           'cpu': s.cpu,
+                           'request_bytes': s.request_bytes,
+                           'response_bytes': s.response_bytes,
+                           'latency': s.latency.to_dict()}
+                    for name, s in self.__methods.items()}
+
+    def reset(self):
+        with self.__lock:
+            self.__methods = {}
+
+    def print(self, file, scale=1000):
+        """
+        Print per-method table
+
+        :param file: output file
+        :param scale: time units scale, milliseconds by default
+        """
+        file.write('{:30s}{:10s} {:10s} {:10s} {:10s} {:10s} {:10s} {:12s} {:12s}\n'
+                   .format('Method', 'Calls', 'Errors', 'Mean', 'P50', 'P99', 'CPU', 'Sent', 'Received'))
+        for name, s in sorted(self.snapshot().items()):
+            latency = Histogram.from_dict(s['latency'])
+            file.write('{:30s}{:<10d} {:<10d} {:<10.3g} {:<10.3g} {:<10.3g} {:<10.3g} {:<12d} {:<12d}\n'
+                       .format(name, s['count'], s['errors'], latency.mean * scale, latency.median * scale,
+                               latency.percentile(99) * scale, s['cpu'] * scale / s['count'],
+                               s['request_bytes'], s['response_bytes']))
+
+
+class SlowCallLog(Interceptor):
+    """
+    Log calls slower than a threshold and keep the most recent ones
+    """
+
+    DEFAULT_THRESHOLD = 1.0
+    DEFAULT_KEEP = 100
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, keep=DEFAULT_KEEP):
+        """
+        :param threshold: seconds
+        :param keep: number of slow calls kept in memory
+        """
+        self.__threshold = threshold
+        self.__calls = collections.deque(maxlen=keep)
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def calls(self):
+        """
+        :return: most recent slow calls, oldest first
+        :rtype: list[CallRecord]
+        """
+        return list(self.__calls)
+
+    def on_call(self, record):
+        if record.wall < self.__threshold:
+            return
+        self.__calls.append(record)
+        self.logger.warning('slow call %s: %.3f sec, %.3f sec CPU, %d bytes sent, %d received%s',
+                            record.method, record.wall, record.cpu, record.request_bytes, record.response_bytes,
+                            ', failed: {}'.format(record.error) if record.error is not None else '')
@@ -0,0 +1,106 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Client memory use of a single call, measured with tracemalloc.
+
+tracemalloc slows down allocations a lot, so memory is measured on separate
+calls and never while timing.
+"""
+
+import linecache
+import os
+import re
+import tracemalloc
+
+# Number of allocation sites kept for every measured call
+TOP_SITES = 5
+
+
+class MemoryUsage(object):
+    """
+    Python heap use of a single call
+    """
+
+    def __init__(self, peak, retained, sites):
+        """
+        :param peak: largest number of bytes allocated during the call, including its result
+        :param retained: bytes still allocated after the call result is released
+        :param sites: list of (file:line, bytes, number of blocks) for the largest allocation sites
+            of memory held when the call returns, result included
+        """
+        self.peak = peak
+        self.retained = retained
+        self.sites = sites
+
+
+_DEFINITION = re.compile(r'^(\s*)(?:def|class)\s+(\w+)')
+
+
+def _scope(filename, lineno):
+    """
+    :return: enclosing class and function names of a source line, e.g. 'Partition.read', or None
+    """
+    names = []
+    line = linecache.getline(filename, lineno)
+    indent = len(line) - len(line.lstrip())
+    while lineno > 1 and indent > 0:
+        lineno -= 1
+        m = _DEFINITION.match(linecache.getline(filename, lineno))
+        if m and len(m.group(1)) < indent:
+            names.append(m.group(2))
+            indent = len(m.group(1))
+    return '.'.join(reversed(names)) or None
+
+
+def _site(frame):
+    """
+    :return: allocation site as file:line with the enclosing function, e.g. 'ttypes.py:2653 Partition.read'
+    """
+    site = '{}:{}'.format(os.path.basename(frame.filename), frame.lineno)
+    scope = _scope(frame.filename, frame.lineno)
+    return '{} {}'.format(site, scope) if scope else site
+
+
+def measure_call(what, top=TOP_SITES):
+    """
+    Call what() once under tracemalloc
+
+    :param what: function to measure, its return value is kept alive until allocation sites are taken
+    :param top: number of allocation sites to keep
+    :return: memory use of the call
+    :rtype: MemoryUsage
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        baseline = tracemalloc.get_traced_memory()[0]
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        result = what()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        own = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        diffs = tracemalloc.take_snapshot().filter_traces(own).compare_to(before.filter_traces(own), 'lineno')
+        largest = [(diff.traceback[0], diff.size_diff, diff.count_diff)
+                   for diff in diffs[:top] if diff.size_diff > 0]
+        del result, diffs
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        if started:
+            tracemalloc.stop()
+    # Reading sources for site names allocates too, so do it after measuring
+    return MemoryUsage(peak, retained, [(_site(frame), size, count) for frame, size, count in largest])
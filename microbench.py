@@ -13,11 +13,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import gc
 import logging
+import statistics
 import time
+from contextlib import contextmanager
 from sys import version_info
 
 from distributionstatistics import Statistics
+from memoryprofile import measure_call
 
 
 # noinspection SpellCheckingInspection
@@ -25,62 +29,252 @@ class MicroBench(object):
 
     DEFAULT_ITERATIONS = 100
     DEFAULT_WARMUP = 15
+    # Warm up until latency is stable
+    AUTO = 'auto'
+    # Automatic warmup compares medians of the last two windows of this many calls
+    AUTO_WINDOW = 10
+    # Relative difference of window medians considered stable
+    AUTO_TOLERANCE = 0.1
+    # Maximum coefficient of variation within a stable window
+    AUTO_MAX_CV = 0.5
+    # Upper limit for automatic warmup
+    MAX_WARMUP = 1000
     VERSION = version_info[0]
     timer = time.time
 
-    def __init__(self, warmup=DEFAULT_WARMUP, iterations=DEFAULT_ITERATIONS):
+    def __init__(self, warmup=DEFAULT_WARMUP, iterations=DEFAULT_ITERATIONS, counter=None, disable_gc=False,
+                 memory=False, profiler=None, on_start=None):
+        """
+        :param warmup: number of warmup iterations or AUTO
+        :param iterations: number of measured iterations
+        :param counter: function returning (bytes sent, bytes received) totals, when set
+            results include mean bytes per measured call
+        :param disable_gc: collect garbage before measurement and disable the cyclic garbage
+            collector while measuring. Collections that still happen are reported in results.
+        :param memory: after measuring time, run one more call under tracemalloc
+            and add its memory use to results
+        :param profiler: after measuring time, run the measured calls again with the profiler enabled
+        :type profiler: Profiler
+        :param on_start: called after the benchmark set up its objects, right before warmup,
+            e.g. to start measurement on all distributed workers at once
+        """
         self.__warmup = warmup
         self.__iterations = iterations
+        self.__disable_gc = disable_gc
+        self.memory = memory
+        self.profiler = profiler
+        self.counter = counter
+        self.on_start = on_start
         if self.VERSION > 2:
             self.timer = time.monotonic
 
+    @property
+    def warmup(self):
+        return self.__warmup
+
+    @property
+    def iterations(self):
+        return self.__iterations
+
+    @property
+    def disable_gc(self):
+        return self.__disable_gc
+
     @staticmethod
     def repeat(what, count):
         for i in range(count):
             what()
 
+    @classmethod
+    def _stable(cls, previous, current):
+        """
+        Latency is stable when medians of adjacent windows are close (no change point)
+        and the last window has no large outliers (low coefficient of variation)
+        """
+        a = statistics.median(previous)
+        b = statistics.median(current)
+        if abs(a - b) > cls.AUTO_TOLERANCE * max(a, b):
+            return False
+        mean = statistics.mean(current)
+        return not mean or statistics.stdev(current) / mean <= cls.AUTO_MAX_CV
+
+    def _warmup(self, timed):
+        """
+        Run warmup iterations
+
+        :param timed: function running one iteration and returning its latency
+        :return: number of warmup iterations
+        """
+        if self.__warmup != self.AUTO:
+            self.repeat(timed, self.__warmup)
+            return self.__warmup
+        window = self.AUTO_WINDOW
+        latencies = []
+        while len(latencies) < self.MAX_WARMUP:
+            latencies.append(timed())
+            if len(latencies) >= 2 * window and self._stable(latencies[-2 * window:-window], latencies[-window:]):
+                break
+        else:
+            logging.getLogger(__name__).warning('latency is not stable after %d warmup iterations', self.MAX_WARMUP)
+        return len(latencies)
+
+    @contextmanager
+    def _gc_control(self, stats):
+        """
+        Disable GC for the measured region if requested and record GC pauses in stats.
+        Only pauses while the yielded flag is set are recorded, callers set it around
+        the timed call so collections in pre() and post() are not reported.
+        """
+        pauses = []
+        started = []
+        timing = [False]
+
+        def on_gc(phase, info):
+            if phase == 'start':
+                if timing[0]:
+                    started.append(self.timer())
+            elif started:
+                pauses.append(self.timer() - started.pop())
+
+        enabled = gc.isenabled()
+        if self.__disable_gc:
+            # Start from a clean heap and keep surviving objects out of any later collection
+            gc.collect()
+            if hasattr(gc, 'freeze'):
+                gc.freeze()
+            gc.disable()
+        gc.callbacks.append(on_gc)
+        try:
+            yield timing
+        finally:
+            gc.callbacks.remove(on_gc)
+            if self.__disable_gc:
+                if hasattr(gc, 'unfreeze'):
+                    gc.unfreeze()
+                if enabled:
+                    gc.enable()
+            stats.gc_pauses = len(pauses)
+            stats.gc_time = sum(pauses)
+
+    def start(self):
+        """
+        Called by benchmarks when setup is done and measurement begins
+        """
+        if self.on_start:
+            self.on_start()
+
+    def _time(self, what):
+        start = self.timer()
+        what()
+        return self.timer() - start
+
     def bench_simple(self, what):
+        self.start()
         # Warmup
         logger = logging.getLogger(__name__)
         logger.debug("warming up")
-        self.repeat(what, self.__warmup)
+        warmup = self._warmup(lambda: self._time(what))
         stats = Statistics()
+        stats.warmup = warmup
+        transferred = [0, 0]
 
         def measure():
+            before = self._bytes()
+            timing[0] = True
             start = self.timer()
             what()
             end = self.timer()
+            timing[0] = False
             stats.add(end - start)
+            self._count(before, transferred)
 
         logger.debug("measuring time")
-        self.repeat(measure, self.__iterations)
+        with self._gc_control(stats) as timing:
+            self.repeat(measure, self.__iterations)
         logger.debug("mean time is %g seconds", stats.mean)
-        return stats
+        if self.memory:
+            stats.memory = measure_call(what)
+        self._profile(None, what, None)
+        return self._add_bytes(stats, transferred)
 
     def bench(self, pre=None, what=None, post=None):
+        self.start()
         logger = logging.getLogger(__name__)
 
         def warmup():
             if pre:
                 pre()
-            what()
+            elapsed = self._time(what)
             if post:
                 post()
+            return elapsed
+
+        transferred = [0, 0]
 
         def measure():
             if pre:
                 pre()
+            before = self._bytes()
+            timing[0] = True
             start = self.timer()
             what()
             end = self.timer()
+            timing[0] = False
             stats.add(end - start)
+            self._count(before, transferred)
             if post:
                 post()
 
         stats = Statistics()
         logger.debug("warming up")
-        self.repeat(warmup, self.__warmup)
+        stats.warmup = self._warmup(warmup)
         logger.debug("measuring time")
-        self.repeat(measure, self.__iterations)
+        with self._gc_control(stats) as timing:
+            self.repeat(measure, self.__iterations)
         logger.debug("mean time is %g seconds", stats.mean)
+        if self.memory:
+            if pre:
+                pre()
+            stats.memory = measure_call(what)
+            if post:
+                post()
+        self._profile(pre, what, post)
+        return self._add_bytes(stats, transferred)
+
+    def _profile(self, pre, what, post):
+        """
+        Repeat measured calls under the profiler, profiling overhead never affects timing
+        """
+        if not self.profiler:
+            return
+        logging.getLogger(__name__).debug("profiling")
+        for _ in range(self.__iterations):
+            if pre:
+                pre()
+            self.profiler.enable()
+            try:
+                what()
+            finally:
+                self.profiler.disable()
+            if post:
+                post()
+
+    def _bytes(self):
+        return self.counter() if self.counter else None
+
+    def _count(self, before, transferred):
+        """
+        Add bytes transferred since before to transferred totals
+        """
+        if before:
+            sent, received = self.counter()
+            transferred[0] += sent - before[0]
+            transferred[1] += received - before[1]
+
+    @staticmethod
+    def _add_bytes(stats, transferred):
+        # Benchmarks that do not use the counted connection report nothing
+        if any(transferred) and stats.data:
+            stats.request_bytes = transferred[0] / len(stats.data)
+            stats.response_bytes = transferred[1] / len(stats.data)
         return stats
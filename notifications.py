@@ -0,0 +1,230 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Notification log consumer
+"""
+
+import logging
+import os
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    # noinspection PyUnresolvedReferences,PyPep8Naming
+    import Queue as queue
+
+
+class NotificationStream(object):
+    """
+    Tail HMS notification log.
+
+    A background thread fetches batches of events with get_next_notification
+    while the caller processes previous ones. Fetched batches wait in a bounded queue,
+    so a slow consumer stops fetching instead of buffering the whole log.
+
+    With adaptive sizing the batch grows while full batches come back faster than
+    TARGET_LATENCY and shrinks when they are slower.
+
+    The stream owns the client: nothing else should use it while the stream is open.
+
+    Usage:
+
+        with NotificationStream(HMSClient(host, port).open(), checkpoint='/var/run/hms.id') as stream:
+            for event in stream:
+                process(event)
+                stream.checkpoint()
+    """
+
+    DEFAULT_BATCH_SIZE = 1000
+    MIN_BATCH_SIZE = 10
+    MAX_BATCH_SIZE = 50000
+    # Number of batches fetched ahead of the consumer
+    DEFAULT_QUEUE_SIZE = 4
+    # Seconds to wait before asking again when there are no new events
+    DEFAULT_POLL_INTERVAL = 1.0
+    # Desired time of one fetch in seconds
+    TARGET_LATENCY = 0.5
+
+    def __init__(self, client, last_event=None, batch_size=DEFAULT_BATCH_SIZE, adaptive=True,
+                 queue_size=DEFAULT_QUEUE_SIZE, poll_interval=DEFAULT_POLL_INTERVAL, checkpoint=None,
+                 stop_at=None):
+        """
+        :param client: open HMS client used only by the stream
+        :type client: HMSClient
+        :param last_event: id of the last processed event, events after it are returned.
+            By default it is read from the checkpoint file, or the current event id is used.
+        :type last_event: int
+        :param batch_size: initial number of events fetched at once
+        :param adaptive: adjust batch size to fetch latency
+        :param queue_size: number of batches fetched ahead
+        :param poll_interval: seconds to wait when there are no new events
+        :param checkpoint: file keeping the id of the last processed event
+        :type checkpoint: str
+        :param stop_at: stop after the event with this id instead of waiting for new events
+        :type stop_at: int
+        """
+        self.__client = client
+        self.__batch_size = batch_size
+        self.__adaptive = adaptive
+        self.__poll_interval = poll_interval
+        self.__checkpoint = checkpoint
+        self.__stop_at = stop_at
+        self.__queue = queue.Queue(queue_size)
+        self.__stopped = threading.Event()
+        self.__thread = None
+        self.logger = logging.getLogger(__name__)
+
+        if last_event is None and checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                last_event = int(f.read().strip())
+        if last_event is None:
+            last_event = client.get_current_notification_id()
+        self.__last_event = last_event
+        self.__fetched_event = last_event
+
+    @property
+    def last_event(self):
+        """
+        :return: id of the last event returned to the caller
+        :rtype: int
+        """
+        return self.__last_event
+
+    @property
+    def batch_size(self):
+        """
+        :return: current batch size
+        :rtype: int
+        """
+        return self.__batch_size
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        """
+        Start fetching events in the background
+
+        :return: self
+        """
+        if not self.__thread:
+            self.__thread = threading.Thread(target=self._fetch, name='notification-stream')
+            self.__thread.daemon = True
+            self.__thread.start()
+        return self
+
+    def close(self):
+        """
+        Stop fetching events
+        """
+        self.__stopped.set()
+        if self.__thread:
+            # Unblock the fetcher if it waits for space in the queue
+            while self.__thread.is_alive():
+                try:
+                    self.__queue.get_nowait()
+                except queue.Empty:
+                    pass
+                self.__thread.join(0.1)
+            self.__thread = None
+
+    def _put(self, item):
+        # Blocks while the queue is full, this is the backpressure on the fetcher
+        while not self.__stopped.is_set():
+            try:
+                self.__queue.put(item, timeout=self.__poll_interval)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _resize(self, fetched, elapsed):
+        if not self.__adaptive or fetched < self.__batch_size:
+            return
+        if elapsed < self.TARGET_LATENCY / 2:
+            self.__batch_size = min(self.MAX_BATCH_SIZE, self.__batch_size * 2)
+        elif elapsed > self.TARGET_LATENCY:
+            self.__batch_size = max(self.MIN_BATCH_SIZE, self.__batch_size // 2)
+
+    def _fetch(self):
+        try:
+            while not self.__stopped.is_set():
+                if self.__stop_at is not None and self.__fetched_event >= self.__stop_at:
+                    break
+                start = time.monotonic()
+                events = self.__client.get_next_notification(self.__fetched_event, self.__batch_size)
+                self._resize(len(events), time.monotonic() - start)
+                if self.__stop_at is not None:
+                    events = [e for e in events if e.eventId <= self.__stop_at]
+                    if not events:
+                        break
+                if not events:
+                    self.__stopped.wait(self.__poll_interval)
+                    continue
+                self.__fetched_event = events[-1].eventId
+                if not self._put(events):
+                    return
+            self._put(None)
+        except Exception as e:
+            self.logger.exception('failed to fetch notifications after event %d', self.__fetched_event)
+            self._put(e)
+
+    def _batches(self):
+        self.start()
+        while True:
+            batch = self.__queue.get()
+            if batch is None:
+                return
+            if isinstance(batch, Exception):
+                raise batch
+            yield batch
+
+    def batches(self):
+        """
+        Iterate over batches of events, fetching starts if needed
+
+        :return: generator of lists of NotificationEvent
+        """
+        for batch in self._batches():
+            self.__last_event = batch[-1].eventId
+            yield batch
+
+    def __iter__(self):
+        for batch in self._batches():
+            for event in batch:
+                self.__last_event = event.eventId
+                yield event
+
+    def checkpoint(self, event_id=None):
+        """
+        Save id of the last processed event to the checkpoint file
+
+        :param event_id: event id, last event returned by the stream by default
+        :type event_id: int
+        """
+        if not self.__checkpoint:
+            return
+        event_id = self.__last_event if event_id is None else event_id
+        # Write and rename, so a crash never leaves a partial file
+        tmp = self.__checkpoint + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write('{}\n'.format(event_id))
+        os.rename(tmp, self.__checkpoint)
@@ -0,0 +1,232 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+CPU profiles of benchmarks and client commands.
+
+Every profiled run writes two files to the output directory:
+
+    <name>.pstats     cProfile statistics of the profiling thread, for pstats or snakeviz
+    <name>.collapsed  sampled stacks of all busy threads, one 'frame;frame;... count' line
+                      per stack, for flamegraph.pl, speedscope and similar tools
+
+Hotspots are computed from the sampled stacks, so they include work done on pool threads.
+"""
+
+import cProfile
+import collections
+import os
+import sys
+import threading
+from contextlib import contextmanager
+
+# Seconds between stack samples
+SAMPLE_INTERVAL = 0.001
+# Number of hotspots printed for every profile
+TOP = 10
+# Innermost frames of threads waiting for work, as (file name, function)
+_IDLE = {
+    ('threading.py', 'wait'),
+    ('thread.py', '_worker'),
+    ('queue.py', 'get'),
+    ('selectors.py', 'select'),
+}
+
+
+def _frame_name(frame):
+    return '{}:{}'.format(os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+
+
+def _stack(frame):
+    """
+    :return: collapsed stack, outermost frame first
+    """
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Profiler(object):
+    """
+    Profile named runs, e.g. one run per benchmark.
+
+    Usage:
+
+        profiler = Profiler('profiles')
+        with profiler.profile('getTable'):
+            ...
+
+    Or, to profile only parts of a run:
+
+        profiler.begin('getTable')
+        for ...:
+            profiler.enable()
+            ...
+            profiler.disable()
+        profiler.end()
+    """
+
+    def __init__(self, directory, interval=SAMPLE_INTERVAL):
+        """
+        :param directory: output directory, created if missing
+        :param interval: seconds between stack samples
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.__directory = directory
+        self.__interval = interval
+        self.__name = None
+        self.__profile = None
+        self.__samples = None
+        self.__active = False
+        self.__stop = None
+        self.__sampler = None
+        self.__runs = []
+
+    @property
+    def directory(self):
+        return self.__directory
+
+    @property
+    def runs(self):
+        """
+        :return: names of runs written by this profiler, in the order they finished
+        :rtype: list[str]
+        """
+        return self.__runs
+
+    def record(self, name):
+        """
+        Add a run written by another process with a copy of this profiler, e.g. a forked child
+
+        :param name: run name passed to begin()
+        """
+        name = name.replace(os.sep, '_')
+        if name not in self.__runs:
+            self.__runs.append(name)
+
+    def _sample(self, stop):
+        me = threading.current_thread().ident
+        while not stop.wait(self.__interval):
+            if not self.__active:
+                continue
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in _IDLE:
+                    continue
+                self.__samples[_stack(frame)] += 1
+
+    def begin(self, name):
+        """
+        Start profiling run, the profiler stays disabled until enable()
+
+        :param name: run name, used for output file names
+        """
+        self.__name = name.replace(os.sep, '_')
+        self.__profile = cProfile.Profile()
+        self.__samples = collections.Counter()
+        self.__stop = threading.Event()
+        self.__sampler = threading.Thread(target=self._sample, args=(self.__stop,), name='profiler')
+        self.__sampler.daemon = True
+        self.__sampler.start()
+
+    def enable(self):
+        self.__profile.enable()
+        self.__active = True
+
+    def disable(self):
+        self.__active = False
+        self.__profile.disable()
+
+    def end(self):
+        """
+        Finish the run and write its files
+        """
+        self.__stop.set()
+        self.__sampler.join()
+        path = os.path.join(self.__directory, self.__name)
+        self.__profile.dump_stats(path + '.pstats')
+        with open(path + '.collapsed', 'w') as f:
+            for stack, count in sorted(self.__samples.items()):
+                f.write('{} {}\n'.format(stack, count))
+        self.__profile = self.__samples = self.__sampler = None
+        self.record(self.__name)
+
+    @contextmanager
+    def profile(self, name):
+        """
+        Profile everything inside the with block as one run
+        """
+        self.begin(name)
+        self.enable()
+        try:
+            yield self
+        finally:
+            self.disable()
+            self.end()
+
+
+def read_collapsed(path):
+    """
+    :return: maps collapsed stack to number of samples
+    :rtype: collections.Counter
+    """
+    samples = collections.Counter()
+    with open(path) as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack:
+                samples[stack] += int(count)
+    return samples
+
+
+def hotspots(samples, count=TOP):
+    """
+    :param samples: maps collapsed stack to number of samples
+    :param count: number of functions to return
+    :return: list of (function, self share, total share) sorted by self share;
+        self share counts samples with the function on top of the stack,
+        total share counts samples with the function anywhere in the stack
+    """
+    total = sum(samples.values())
+    if not total:
+        return []
+    own = collections.Counter()
+    anywhere = collections.Counter()
+    for stack, n in samples.items():
+        frames = stack.split(';')
+        own[frames[-1]] += n
+        for frame in set(frames):
+            anywhere[frame] += n
+    return [(frame, float(n) / total, float(anywhere[frame]) / total) for frame, n in own.most_common(count)]
+
+
+def print_hotspots(profiler, file, count=TOP):
+    """
+    Print top functions of every run of the profiler, other profiles in its directory are ignored
+
+    :type profiler: Profiler
+    """
+    for name in profiler.runs:
+        path = os.path.join(profiler.directory, name + '.collapsed')
+        if not os.path.exists(path):
+            continue
+        spots = hotspots(read_collapsed(path), count)
+        if not spots:
+            continue
+        file.write('\n{:60s}{:8s} {:8s}\n'.format(name, 'Self%', 'Total%'))
+        for frame, own, total in spots:
+            file.write('  {:58s}{:<8.1f} {:<8.1f}\n'.format(frame, own * 100, total * 100))
@@ -0,0 +1,111 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Progress reporting for long running bulk operations
+"""
+
+import threading
+import time
+
+
+class Progress(object):
+    """
+    Count processed objects and show a progress line with rate and ETA.
+
+    The line is rewritten in place at most every REFRESH seconds and only when
+    the output is a terminal. Safe to update from several threads.
+    """
+
+    REFRESH = 0.5
+
+    def __init__(self, operation, file, total=None, unit='objects'):
+        """
+        :param operation: operation name shown in the progress line, e.g. 'dropped'
+        :param file: output file, usually stderr
+        :param total: expected number of objects, if known
+        :type total: int
+        :param unit: name of counted objects
+        """
+        self.__operation = operation
+        self.__file = file
+        self.__total = total
+        self.__unit = unit
+        self.__done = 0
+        self.__failed = 0
+        self.__start = time.monotonic()
+        self.__shown = 0.0
+        self.__live = hasattr(file, 'isatty') and file.isatty()
+        self.__lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self.__done
+
+    @property
+    def failed(self):
+        return self.__failed
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.__start
+
+    @property
+    def rate(self):
+        """
+        :return: processed objects per second
+        :rtype: float
+        """
+        elapsed = self.elapsed
+        return self.__done / elapsed if elapsed else 0.0
+
+    def update(self, count=1, failed=0):
+        """
+        Record processed objects
+
+        :param count: number of successfully processed objects
+        :param failed: number of failed objects
+        """
+        with self.__lock:
+            self.__done += count
+            self.__failed += failed
+            now = time.monotonic()
+            if self.__live and now - self.__shown >= self.REFRESH:
+                self.__shown = now
+                self.__file.write('\r' + self._line())
+                self.__file.flush()
+
+    def _line(self):
+        line = '{} {}'.format(self.__operation, self.__done)
+        if self.__total is not None:
+            line += '/{}'.format(self.__total)
+        line += ' {}, {:.1f}/sec'.format(self.__unit, self.rate)
+        if self.__failed:
+            line += ', {} failed'.format(self.__failed)
+        processed = self.__done + self.__failed
+        if self.__total is not None and processed and self.__total > processed:
+            eta = self.elapsed * (self.__total - processed) / processed
+            line += ', ETA {:.0f}s'.format(eta)
+        return line
+
+    def finish(self):
+        """
+        Print summary line
+        """
+        if self.__live:
+            self.__file.write('\r\033[K')
+        self.__file.write('{} {} {} in {:.3g} seconds ({:.1f} {}/sec){}\n'
+                          .format(self.__operation, self.__done, self.__unit, self.elapsed, self.rate, self.__unit,
+                                  ', {} failed'.format(self.__failed) if self.__failed else ''))
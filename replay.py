@@ -0,0 +1,282 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Trace-driven workload replay
+"""
+
+import json
+import logging
+import random
+import socket
+import threading
+import time
+from collections import namedtuple
+
+from thrift.protocol.TProtocol import TProtocolException
+from thrift.transport.TTransport import TTransportException
+
+from distributionstatistics import Statistics
+from hmsclient import HMSClient
+
+try:
+    import queue
+except ImportError:
+    # noinspection PyUnresolvedReferences,PyPep8Naming
+    import Queue as queue
+
+TraceEvent = namedtuple('TraceEvent', ['timestamp', 'api', 'args'])
+
+# Errors after which the connection may be out of sync with the server, e.g. a timed out
+# call whose reply arrives later, so the connection is replaced
+CONNECTION_ERRORS = (TTransportException, TProtocolException, socket.error)
+
+# Prefix used by HMS for API timers in the metrics file
+API_PREFIX = 'api_'
+
+
+def read_jsonl_trace(file):
+    """
+    Read trace from a JSONL file with one call per line, e.g.
+
+        {"timestamp": 1.25, "api": "get_table", "args": ["default", "t1"]}
+
+    Timestamps are in seconds, only their differences matter.
+    Arguments are positional (list) or keyword (dict) Thrift method arguments.
+
+    :param file: open file
+    :return: generator of TraceEvent
+    """
+    for lineno, line in enumerate(file, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            yield TraceEvent(float(record['timestamp']), record['api'], record.get('args', []))
+        except (ValueError, KeyError) as e:
+            raise ValueError('invalid trace record at line {}: {}'.format(lineno, e))
+
+
+# Arguments used for APIs in traces synthesized from metrics, which only have call counts
+_METRICS_ARGS = {
+    'get_all_databases': lambda db, table: [],
+    'get_databases': lambda db, table: ['*'],
+    'get_database': lambda db, table: [db],
+    'get_all_tables': lambda db, table: [db],
+    'get_tables': lambda db, table: [db, '*'],
+    'get_table': lambda db, table: [db, table],
+    'get_table_meta': lambda db, table: [db, table, []],
+    'get_partitions': lambda db, table: [db, table, -1],
+    'get_partition_names': lambda db, table: [db, table, -1],
+    'get_partitions_by_filter': lambda db, table: [db, table, '', -1],
+    'get_num_partitions_by_filter': lambda db, table: [db, table, ''],
+    'get_fields': lambda db, table: [db, table],
+    'get_schema': lambda db, table: [db, table],
+    'get_current_notificationEventId': lambda db, table: [],
+    'get_config_value': lambda db, table: ['hive.metastore.uris', ''],
+}
+
+
+def metrics_api_mix(metrics):
+    """
+    Extract API call counts from HMS Codahale metrics, see tools/metricsdump.py
+
+    :param metrics: parsed metrics JSON
+    :type metrics: dict
+    :return: maps API name to call count
+    :rtype: dict
+    """
+    mix = {}
+    for name, values in metrics.get('timers', {}).items():
+        if name.startswith(API_PREFIX) and values.get('count'):
+            mix[name[len(API_PREFIX):]] = values['count']
+    return mix
+
+
+def trace_from_metrics(metrics, db, table, rate, duration, seed=None):
+    """
+    Synthesize trace with the API mix of HMS metrics.
+
+    Metrics only have call counts, so calls are issued as a Poisson process
+    with the given rate and API chosen with probability proportional to its count.
+    APIs with unknown arguments are skipped.
+
+    :param metrics: parsed metrics JSON
+    :type metrics: dict
+    :param db: database used as argument
+    :param table: table used as argument
+    :param rate: calls per second
+    :type rate: float
+    :param duration: trace duration in seconds
+    :type duration: float
+    :param seed: random seed for reproducible traces
+    :return: generator of TraceEvent
+    """
+    logger = logging.getLogger(__name__)
+    mix = metrics_api_mix(metrics)
+    skipped = sorted(api for api in mix if api not in _METRICS_ARGS)
+    if skipped:
+        logger.warning('skipping APIs with unknown arguments: %s', ', '.join(skipped))
+    apis = sorted(api for api in mix if api in _METRICS_ARGS)
+    if not apis:
+        raise ValueError('no replayable APIs in metrics')
+    weights = [mix[api] for api in apis]
+    rnd = random.Random(seed)
+    timestamp = 0.0
+    while True:
+        timestamp += rnd.expovariate(rate)
+        if timestamp >= duration:
+            return
+        api = rnd.choices(apis, weights)[0]
+        yield TraceEvent(timestamp, api, _METRICS_ARGS[api](db, table))
+
+
+class Replayer(object):
+    """
+    Re-issue trace against HMS over several concurrent clients.
+
+    Events are dispatched at their trace time divided by speed, so speed 2 replays
+    twice as fast and speed 0 issues calls as fast as clients can take them.
+    """
+
+    # Maximum number of dispatched events waiting for a client
+    QUEUE_SIZE = 1000
+
+    def __init__(self, host, port, clients=1, speed=1.0):
+        """
+        :param host: HMS host
+        :param port: HMS port
+        :param clients: number of concurrent clients
+        :type clients: int
+        :param speed: timing scale factor, 0 means no delays
+        :type speed: float
+        """
+        self.__host = host
+        self.__port = port
+        self.__clients = clients
+        self.__speed = speed
+        self.__lag = Statistics()
+        self.__errors = {}
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def lag(self):
+        """
+        :return: delay between scheduled and actual call start, high lag means clients can't keep up
+        :rtype: Statistics
+        """
+        return self.__lag
+
+    @property
+    def errors(self):
+        """
+        :return: maps API name to number of failed calls
+        :rtype: dict
+        """
+        return self.__errors
+
+    def run(self, events):
+        """
+        Replay trace
+
+        :param events: iterable of TraceEvent ordered by timestamp
+        :return: maps API name to latency statistics
+        :rtype: dict
+        """
+        work = queue.Queue(self.QUEUE_SIZE)
+        # Every worker has its own latencies, errors and lag, merged once all of them finish
+        results = [({}, {}, Statistics()) for _ in range(self.__clients)]
+        workers = [threading.Thread(target=self._worker, args=(work,) + results[i],
+                                    name='replay-{}'.format(i))
+                   for i in range(self.__clients)]
+        for w in workers:
+            w.daemon = True
+            w.start()
+        try:
+            self._dispatch(events, work)
+        finally:
+            for _ in workers:
+                work.put(None)
+            for w in workers:
+                w.join()
+
+        latencies = {}
+        for stats, errors, lag in results:
+            for api, data in stats.items():
+                latencies.setdefault(api, Statistics()).data.extend(data.data)
+            for api, count in errors.items():
+                self.__errors[api] = self.__errors.get(api, 0) + count
+            self.__lag.data.extend(lag.data)
+        return latencies
+
+    def _dispatch(self, events, work):
+        start = time.monotonic()
+        first = None
+        for event in events:
+            if first is None:
+                first = event.timestamp
+            due = start
+            if self.__speed:
+                due += (event.timestamp - first) / self.__speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            work.put((due, event))
+
+    def _worker(self, work, stats, errors, lag):
+        try:
+            client = HMSClient(self.__host, self.__port).open()
+        except Exception:
+            # Keep draining the queue, so the dispatcher never blocks on a dead worker
+            self.logger.exception('replay client failed to connect, its events are counted as errors')
+            while True:
+                item = work.get()
+                if item is None:
+                    return
+                api = item[1].api
+                errors[api] = errors.get(api, 0) + 1
+        try:
+            while True:
+                item = work.get()
+                if item is None:
+                    return
+                due, event = item
+                start = time.monotonic()
+                lag.add(max(0.0, start - due))
+                try:
+                    if isinstance(event.args, dict):
+                        client.call(event.api, **event.args)
+                    else:
+                        client.call(event.api, *event.args)
+                except Exception as e:
+                    # Failed calls are counted but not timed, a replay should not stop on them
+                    self.logger.debug('%s failed: %s', event.api, e)
+                    errors[event.api] = errors.get(event.api, 0) + 1
+                    if isinstance(e, CONNECTION_ERRORS):
+                        self._reconnect(client)
+                    continue
+                stats.setdefault(event.api, Statistics()).add(time.monotonic() - start)
+        finally:
+            client.close()
+
+    def _reconnect(self, client):
+        """
+        Replace a broken connection, if it cannot be opened, the next call fails and tries again
+        """
+        try:
+            client.reconnect()
+        except Exception as e:
+            self.logger.warning('replay client failed to reconnect: %s', e)
@@ -0,0 +1,183 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Scaling analysis for benchmarks run at several object counts
+"""
+
+import csv
+import math
+
+
+class Scaling(object):
+    """
+    Fit latency as a function of the number of objects.
+
+    The linear fit latency = fixed + per_object * N gives the per-object cost,
+    the log-log slope over the upper half of the sweep gives the growth exponent
+    used for the complexity hint.
+    """
+
+    CONSTANT = 'constant'
+    LINEAR = 'linear'
+    SUPERLINEAR = 'superlinear'
+
+    # Latency growth below this ratio across the whole sweep is considered constant
+    MIN_GROWTH = 1.5
+    # Exponent thresholds for the complexity hint
+    CONSTANT_EXPONENT = 0.2
+    LINEAR_EXPONENT = 1.2
+
+    def __init__(self, points):
+        """
+        :param points: list of (object count, latency) tuples
+        :type points: list[(int, float)]
+        """
+        self.__points = sorted(points)
+        self.__fixed, self.__per_object = self._linear_fit(self.__points)
+        self.__exponent = self._exponent(self.__points)
+
+    @property
+    def points(self):
+        return self.__points
+
+    @property
+    def fixed(self):
+        """
+        :return: fitted latency independent of the number of objects
+        :rtype: float
+        """
+        return self.__fixed
+
+    @property
+    def per_object(self):
+        """
+        :return: fitted latency added by every object
+        :rtype: float
+        """
+        return self.__per_object
+
+    @property
+    def exponent(self):
+        """
+        :return: growth exponent k in latency ~ N^k for large N
+        :rtype: float
+        """
+        return self.__exponent
+
+    @property
+    def complexity(self):
+        """
+        :return: one of CONSTANT, LINEAR, SUPERLINEAR
+        :rtype: str
+        """
+        latencies = [t for _, t in self.__points]
+        if min(latencies) <= 0 or max(latencies) / min(latencies) < self.MIN_GROWTH:
+            return self.CONSTANT
+        if self.__exponent <= self.CONSTANT_EXPONENT:
+            return self.CONSTANT
+        if self.__exponent <= self.LINEAR_EXPONENT:
+            return self.LINEAR
+        return self.SUPERLINEAR
+
+    @staticmethod
+    def _least_squares(xs, ys):
+        """
+        :return: (intercept, slope) of the least squares line through the points
+        """
+        n = len(xs)
+        mean_x = sum(xs) / n
+        mean_y = sum(ys) / n
+        sxx = sum((x - mean_x) ** 2 for x in xs)
+        if not sxx:
+            return mean_y, 0.0
+        sxy = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+        slope = sxy / sxx
+        return mean_y - slope * mean_x, slope
+
+    @classmethod
+    def _linear_fit(cls, points):
+        return cls._least_squares([float(n) for n, _ in points], [t for _, t in points])
+
+    @classmethod
+    def _exponent(cls, points):
+        # Fixed per-call overhead hides the growth at small N, so only look at the upper half
+        usable = [(n, t) for n, t in points if n > 0 and t > 0]
+        if len(usable) < 2:
+            return 0.0
+        upper = usable[len(usable) // 2:] if len(usable) > 3 else usable
+        _, slope = cls._least_squares([math.log(n) for n, _ in upper], [math.log(t) for _, t in upper])
+        return slope
+
+
+class ScalingReport(object):
+    """
+    Per-benchmark table of latency versus number of objects
+    """
+
+    def __init__(self, result, sweeps, scale=1, per_label='PerObj'):
+        """
+        :param result: benchmark results as returned by BenchSuite.result
+        :type result: dict
+        :param sweeps: maps benchmark base name to list of (object count, benchmark name)
+        :type sweeps: dict
+        :param scale: time units scale
+        :param per_label: header for the per-object cost, for sweeps over something other than object count
+        :type per_label: str
+        """
+        self.__scale = scale
+        self.__per_label = per_label
+        self.__counts = sorted({n for points in sweeps.values() for n, _ in points})
+        self.__scaling = {}
+        for base, points in sweeps.items():
+            measured = [(n, result[name].mean) for n, name in points if name in result]
+            if measured:
+                self.__scaling[base] = Scaling(measured)
+
+    @property
+    def scaling(self):
+        """
+        :return: maps benchmark base name to its Scaling
+        :rtype: dict
+        """
+        return self.__scaling
+
+    def _rows(self, fmt):
+        for base in sorted(self.__scaling.keys()):
+            scaling = self.__scaling[base]
+            latencies = dict(scaling.points)
+            values = [fmt.format(latencies[n] * self.__scale) if n in latencies else '-'
+                      for n in self.__counts]
+            values += [fmt.format(scaling.fixed * self.__scale),
+                       fmt.format(scaling.per_object * self.__scale),
+                       '{:.2f}'.format(scaling.exponent),
+                       scaling.complexity]
+            yield base, values
+
+    def _header(self):
+        return ['{:g}'.format(n) for n in self.__counts] + ['Fixed', self.__per_label, 'Exp', 'Complexity']
+
+    def print(self, file):
+        if not self.__scaling:
+            return
+        file.write('{:30s}'.format('Name') + ' '.join('{:10s}'.format(h) for h in self._header()) + '\n')
+        for name, values in self._rows('{:<10.3g}'):
+            file.write('{:30s}'.format(name) + ' '.join('{:10s}'.format(v) for v in values) + '\n')
+
+    def print_csv(self, file, delimiter='\t'):
+        writer = csv.writer(file, delimiter=delimiter, quotechar='|', quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(['Name'] + self._header())
+        for name, values in self._rows('{:g}'):
+            writer.writerow([name] + values)
@@ -0,0 +1,316 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Read-only catalog snapshot with on-disk indexes.
+
+File layout:
+
+    MAGIC
+    header: offset and entry count of the database, table and partition indexes
+    records: same encoding as catalogio exports
+    indexes: fixed-width entries sorted by key, followed by the key bytes
+
+Database keys are database names, table keys are <database>\\0<table>, partition keys are
+partition names. Partitions of one table form a contiguous range of the partition index,
+table entries point to it. Lookups binary search the memory-mapped indexes and decode
+only the records they return.
+"""
+
+import mmap
+import struct
+
+from catalogio import encode, decode
+from hive_metastore.ttypes import Database, Table, Partition
+
+MAGIC = b'HMSSNAP1'
+
+# Index offset and number of entries for databases, tables and partitions
+_HEADER = struct.Struct('>QQQQQQ')
+# Key offset, key length, record offset, first child entry, number of children
+_ENTRY = struct.Struct('>QIQQQ')
+# Record type and length, see catalogio
+_RECORD = struct.Struct('>cI')
+
+
+def _table_key(db_name, table_name):
+    return db_name.encode('utf-8') + b'\0' + table_name.encode('utf-8')
+
+
+def partition_name(keys, values):
+    """
+    :param keys: partition key names
+    :param values: partition values
+    :return: partition name in the form key1=value1/key2=value2, values are not escaped
+    :rtype: str
+    """
+    return '/'.join('{}={}'.format(k, v) for k, v in zip(keys, values))
+
+
+class SnapshotWriter(object):
+    """
+    Build snapshot file from Database, Table and Partition objects.
+
+    It has the same write() interface as CatalogWriter, so catalogio.export_catalog()
+    can build a snapshot directly from HMS. Partitions must be written after their table.
+    Only index keys and offsets are kept in memory.
+    """
+
+    def __init__(self, path):
+        self.__file = open(path, 'wb')
+        self.__file.write(MAGIC)
+        self.__file.write(b'\0' * _HEADER.size)
+        self.__offset = len(MAGIC) + _HEADER.size
+        self.__databases = []
+        # Maps table key to (record offset, partition key names)
+        self.__tables = {}
+        # List of (table key, partition name, record offset)
+        self.__partitions = []
+        self.__records = 0
+
+    @property
+    def records(self):
+        return self.__records
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, obj):
+        """
+        :param obj: Database, Table or Partition
+        """
+        if isinstance(obj, Database):
+            self.__databases.append((obj.name.encode('utf-8'), self.__offset))
+        elif isinstance(obj, Table):
+            keys = [k.name for k in obj.partitionKeys or []]
+            self.__tables[_table_key(obj.dbName, obj.tableName)] = (self.__offset, keys)
+        elif isinstance(obj, Partition):
+            key = _table_key(obj.dbName, obj.tableName)
+            if key not in self.__tables:
+                raise ValueError('partition of {}.{} written before its table'.format(obj.dbName, obj.tableName))
+            name = partition_name(self.__tables[key][1], obj.values)
+            self.__partitions.append((key, name.encode('utf-8'), self.__offset))
+        record = encode(obj)
+        self.__file.write(record)
+        self.__offset += len(record)
+        self.__records += 1
+
+    def _write_index(self, entries):
+        """
+        :param entries: sorted list of (key, record offset, first child, number of children)
+        :return: index offset
+        """
+        start = self.__offset
+        key_offset = start + _ENTRY.size * len(entries)
+        for key, record, first, count in entries:
+            self.__file.write(_ENTRY.pack(key_offset, len(key), record, first, count))
+            key_offset += len(key)
+        for key, _, _, _ in entries:
+            self.__file.write(key)
+        self.__offset = key_offset
+        return start
+
+    def close(self):
+        """
+        Write indexes and close the file
+        """
+        self.__partitions.sort()
+        table_entries = []
+        partition_entries = []
+        ranges = {}
+        for key, name, offset in self.__partitions:
+            if key not in ranges:
+                ranges[key] = [len(partition_entries), 0]
+            ranges[key][1] += 1
+            partition_entries.append((name, offset, 0, 0))
+        for key in sorted(self.__tables.keys()):
+            first, count = ranges.get(key, (0, 0))
+            table_entries.append((key, self.__tables[key][0], first, count))
+        db_entries = [(key, offset, 0, 0) for key, offset in sorted(self.__databases)]
+
+        header = []
+        for entries in (db_entries, table_entries, partition_entries):
+            header += [self._write_index(entries), len(entries)]
+        self.__file.seek(len(MAGIC))
+        self.__file.write(_HEADER.pack(*header))
+        self.__file.close()
+
+
+class _Index(object):
+    """
+    Sorted fixed-width index entries in a memory map
+    """
+
+    def __init__(self, data, offset, count):
+        self.__data = data
+        self.__offset = offset
+        self.count = count
+
+    def entry(self, i):
+        """
+        :return: (key offset, key length, record offset, first child, number of children)
+        """
+        return _ENTRY.unpack_from(self.__data, self.__offset + i * _ENTRY.size)
+
+    def key(self, i):
+        key_offset, key_length, _, _, _ = self.entry(i)
+        return self.__data[key_offset:key_offset + key_length]
+
+    def lower_bound(self, key, lo=0, hi=None):
+        """
+        :return: index of the first entry with key not less than the given one
+        """
+        hi = self.count if hi is None else hi
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, key, lo=0, hi=None):
+        """
+        :return: index of the entry with the key or None
+        """
+        hi = self.count if hi is None else hi
+        i = self.lower_bound(key, lo, hi)
+        return i if i < hi and self.key(i) == key else None
+
+    def prefix(self, prefix, lo=0, hi=None):
+        """
+        :return: generator of indexes of entries with keys starting with prefix
+        """
+        hi = self.count if hi is None else hi
+        i = self.lower_bound(prefix, lo, hi)
+        while i < hi:
+            if not self.key(i).startswith(prefix):
+                return
+            yield i
+            i += 1
+
+
+class Snapshot(object):
+    """
+    Read snapshot written by SnapshotWriter.
+
+    The file is memory-mapped, lookups touch only the index pages they search
+    and the records they return.
+
+    Usage:
+
+        with Snapshot('catalog.snap') as snapshot:
+            table = snapshot.get_table('db', 'table')
+            for p in snapshot.get_partitions('db', 'table', 'date=2000-01-01/'):
+                ...
+    """
+
+    def __init__(self, path):
+        self.__file = open(path, 'rb')
+        self.__data = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.__data[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError('{} is not a catalog snapshot'.format(path))
+        header = _HEADER.unpack_from(self.__data, len(MAGIC))
+        self.__databases = _Index(self.__data, header[0], header[1])
+        self.__tables = _Index(self.__data, header[2], header[3])
+        self.__partitions = _Index(self.__data, header[4], header[5])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.__data.close()
+        self.__file.close()
+
+    def _record(self, offset):
+        record_type, length = _RECORD.unpack_from(self.__data, offset)
+        start = offset + _RECORD.size
+        return decode(record_type, self.__data[start:start + length])
+
+    def _table_entry(self, db_name, table_name):
+        i = self.__tables.find(_table_key(db_name, table_name))
+        return self.__tables.entry(i) if i is not None else None
+
+    def get_all_databases(self):
+        """
+        :rtype: list[str]
+        """
+        return [self.__databases.key(i).decode('utf-8') for i in range(self.__databases.count)]
+
+    def get_database(self, db_name):
+        """
+        :return: database or None if it is not in the snapshot
+        :rtype: Database
+        """
+        i = self.__databases.find(db_name.encode('utf-8'))
+        return self._record(self.__databases.entry(i)[2]) if i is not None else None
+
+    def get_all_tables(self, db_name):
+        """
+        :return: names of tables in the database
+        :rtype: list[str]
+        """
+        prefix = db_name.encode('utf-8') + b'\0'
+        return [self.__tables.key(i)[len(prefix):].decode('utf-8') for i in self.__tables.prefix(prefix)]
+
+    def get_table(self, db_name, table_name):
+        """
+        :return: table or None if it is not in the snapshot
+        :rtype: Table
+        """
+        entry = self._table_entry(db_name, table_name)
+        return self._record(entry[2]) if entry else None
+
+    def _partition_range(self, db_name, table_name):
+        entry = self._table_entry(db_name, table_name)
+        if not entry:
+            return 0, 0
+        return entry[3], entry[3] + entry[4]
+
+    def get_partition_names(self, db_name, table_name, prefix=''):
+        """
+        :param prefix: return only partitions with names starting with it, e.g. 'date=2000-01-01/'
+        :return: sorted partition names
+        :rtype: list[str]
+        """
+        lo, hi = self._partition_range(db_name, table_name)
+        return [self.__partitions.key(i).decode('utf-8')
+                for i in self.__partitions.prefix(prefix.encode('utf-8'), lo, hi)]
+
+    def get_partition(self, db_name, table_name, part_name):
+        """
+        :param part_name: partition name, e.g. 'date=2000-01-01/hour=00'
+        :return: partition or None if it is not in the snapshot
+        :rtype: Partition
+        """
+        lo, hi = self._partition_range(db_name, table_name)
+        i = self.__partitions.find(part_name.encode('utf-8'), lo, hi)
+        return self._record(self.__partitions.entry(i)[2]) if i is not None else None
+
+    def get_partitions(self, db_name, table_name, prefix=''):
+        """
+        :param prefix: return only partitions with names starting with it
+        :return: generator of partitions sorted by name, decoded one at a time
+        """
+        lo, hi = self._partition_range(db_name, table_name)
+        for i in self.__partitions.prefix(prefix.encode('utf-8'), lo, hi):
+            yield self._record(self.__partitions.entry(i)[2])
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Estimate HMS capacity from the production API mix and benchmarked per-call costs.
+
+The API mix comes from HMS metrics dumps (see metricsdump.py), per-call costs from
+hbench CSV output. Every call is assumed to keep one of the server's concurrent
+slots busy for its benchmarked latency, so one instance saturates at
+concurrency / (mean cost per call) calls per second.
+APIs without a benchmark use their production mean latency instead.
+"""
+
+from __future__ import print_function
+
+import csv
+import math
+import re
+from argparse import ArgumentParser
+from sys import stdout
+
+from metricsdump import combine, deltas, read_snapshots
+
+# hbench benchmarks for HMS APIs whose names do not follow the camelCase convention
+BENCHMARKS = {
+    'get_all_databases': 'listDb',
+    'get_current_notificationEventId': 'getNotificationId',
+    'get_all_tables': 'listTables',
+    'get_partitions_by_filter': 'getPartitionsByFilter',
+    'alter_table': 'renameTable',
+    'open_txns': 'txn.open',
+    'commit_txn': 'txn.commit',
+    'abort_txn': 'txn.abort',
+    'heartbeat': 'txn.heartbeat',
+    'lock': 'lock.exclusive',
+}
+# Codahale duration units to seconds
+UNITS = {'seconds': 1.0, 'milliseconds': 1e-3, 'microseconds': 1e-6, 'nanoseconds': 1e-9}
+# hbench default time scale, milliseconds
+SCALE = 1000
+
+
+def camel_case(api):
+    """
+    :return: hbench style name for HMS API, e.g. getTable for get_table
+    """
+    parts = api.split('_')
+    return parts[0] + ''.join(p[:1].upper() + p[1:] for p in parts[1:])
+
+
+def read_hbench(f, scale=SCALE):
+    """
+    Read mean latencies from hbench CSV output, only the first table is used
+
+    :param f: CSV file written by hbench --csv
+    :param scale: time units scale used by hbench
+    :return: maps benchmark name to mean latency in seconds
+    :rtype: dict
+    """
+    sample = f.readline()
+    delimiter = ',' if sample.count(',') > sample.count('\t') else '\t'
+    header = next(csv.reader([sample], delimiter=delimiter))
+    mean = header.index('Mean')
+    result = {}
+    for row in csv.reader(f, delimiter=delimiter, quotechar='|'):
+        if not row:
+            break
+        result[row[0]] = float(row[mean]) / scale
+    return result
+
+
+def find_benchmark(api, costs, objects=None, mapping=None):
+    """
+    Sweeps are named <base>.<objects>, or <base>.<selectivity>%.<objects> for filter benchmarks.
+    The sweep point with the given object count is used, otherwise the largest one,
+    which is the most conservative. A benchmark named <base> is used only without a sweep.
+
+    :param api: HMS API name
+    :param costs: benchmark costs
+    :param objects: preferred object count for benchmarks run as sweeps
+    :param mapping: explicit API to benchmark mapping
+    :return: benchmark name or None
+    """
+    base = (mapping or {}).get(api) or BENCHMARKS.get(api) or camel_case(api)
+    pattern = re.compile(re.escape(base) + r'(?:\.(\d+(?:\.\d+)?)%)?\.(\d+)$')
+    sweep = [(int(m.group(2)), float(m.group(1) or 100), name) for name in costs
+             for m in [pattern.match(name)] if m]
+    if objects is not None:
+        matching = [point for point in sweep if point[0] == objects]
+        if matching:
+            return max(matching)[2]
+    if sweep:
+        return max(sweep)[2]
+    return base if base in costs else None
+
+
+def production_mix(names, interval=None):
+    """
+    API mix from metrics dumps. For a series of snapshots only calls between
+    the first and the last one are counted.
+
+    :return: (maps api to (calls, production mean latency in seconds), observed seconds or None)
+    """
+    first = last = None
+    latest = {}
+    for name, snapshot, timestamp in read_snapshots(names, interval):
+        if first is None:
+            first = (snapshot, timestamp)
+        last = (snapshot, timestamp)
+        latest[name] = snapshot
+    if last is None:
+        return {}, None
+
+    def seconds(snapshot):
+        # Codahale timers carry their units
+        for values in snapshot.get('timers', {}).values():
+            return UNITS.get(values.get('duration_units'), UNITS['milliseconds'])
+        return UNITS['milliseconds']
+
+    if len(latest) == 1 and first[0] is not last[0]:
+        unit = seconds(last[0])
+        mix = {api: (calls, weight / calls * unit) for api, (calls, weight) in deltas(first[0], last[0]).items()}
+        window = last[1] - first[1] if last[1] is not None and first[1] is not None else None
+        return mix, window
+    mix = {}
+    for snapshot in latest.values():
+        unit = seconds(snapshot)
+        for api, r in combine([snapshot]).items():
+            if r['count']:
+                calls, weight = mix.get(api, (0, 0.0))
+                mix[api] = (calls + r['count'], weight + r['weight'] * unit)
+    return {api: (calls, weight / calls) for api, (calls, weight) in mix.items()}, None
+
+
+def main():
+    parser = ArgumentParser(description='Estimate HMS capacity from production metrics and hbench results')
+    parser.add_argument('--hbench', required=True, help='hbench CSV output (hbench --csv -o FILE)')
+    parser.add_argument('--scale', default=SCALE, type=int, help='time units scale used by hbench')
+    parser.add_argument('--objects', type=int, help='object count to use from benchmark sweeps')
+    parser.add_argument('--map', action='append', default=[], metavar='API=BENCHMARK',
+                        help='benchmark measuring the API, e.g. get_partitions_by_names=getPartitions.100')
+    parser.add_argument('--concurrency', default=1, type=float,
+                        help='number of calls one HMS instance serves in parallel at the benchmarked latency')
+    parser.add_argument('--utilization', default=0.7, type=float,
+                        help='target utilization of every instance, leaves headroom for bursts')
+    parser.add_argument('--qps', type=float, help='target calls per second to size for')
+    parser.add_argument('--interval', type=float, help='seconds between successive metric snapshots')
+    parser.add_argument('--top', default=20, type=int, help='number of APIs to show')
+    parser.add_argument('files', metavar='FILE', nargs='*', help='HMS metrics files, if empty, stdin is used')
+    args = parser.parse_args()
+
+    with open(args.hbench) as f:
+        costs = read_hbench(f, args.scale)
+    mapping = dict(m.split('=', 1) for m in args.map)
+    mix, window = production_mix(args.files, args.interval)
+    total_calls = sum(calls for calls, _ in mix.values())
+    if not total_calls:
+        print('No API calls in metrics')
+        return 1
+
+    rows = []
+    for api, (calls, prod_latency) in mix.items():
+        benchmark = find_benchmark(api, costs, args.objects, mapping)
+        cost = costs[benchmark] if benchmark else prod_latency
+        rows.append((api, calls / float(total_calls), cost, benchmark))
+    mean_cost = sum(share * cost for _, share, cost, _ in rows)
+    covered = sum(share for _, share, _, benchmark in rows if benchmark)
+
+    out = stdout
+    out.write('{:40s}{:10s} {:12s} {:10s} {}\n'.format('API', 'Calls%', 'Cost(ms)', 'Load%', 'Costed from'))
+    rows.sort(key=lambda r: -r[1] * r[2])
+    for api, share, cost, benchmark in rows[:args.top]:
+        source = 'benchmark ' + benchmark if benchmark else 'production mean latency'
+        out.write('{:40s}{:<10.2f} {:<12.4g} {:<10.2f} {}\n'
+                  .format(api, share * 100, cost * 1000, share * cost * 100 / mean_cost, source))
+    if len(rows) > args.top:
+        out.write('{} more APIs not shown, see --top\n'.format(len(rows) - args.top))
+
+    saturation = args.concurrency / mean_cost
+    out.write('\nCalls with benchmarked cost: {:.1f}%\n'.format(covered * 100))
+    out.write('Mean cost per call: {:.4g} ms\n'.format(mean_cost * 1000))
+    out.write('Saturation throughput per instance: {:.1f} calls/sec\n'.format(saturation))
+    out.write('Usable throughput per instance at {:.0f}% utilization: {:.1f} calls/sec\n'
+              .format(args.utilization * 100, saturation * args.utilization))
+    if window:
+        observed = total_calls / window
+        out.write('Observed load: {:.1f} calls/sec, {:.1f}% of one instance\n'
+                  .format(observed, observed * 100 / saturation))
+    if args.qps:
+        instances = int(math.ceil(args.qps / (saturation * args.utilization)))
+        out.write('Instances needed for {:g} calls/sec: {}\n'.format(args.qps, instances))
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
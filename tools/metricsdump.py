@@ -15,33 +15,265 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from sys import stdout
+"""
+Given Hive metrics files, print in CSV statistics about each api.
+
+A file may hold several concatenated JSON snapshots, e.g. periodic dumps appended
+by a long-lived HMS. Snapshots are parsed one at a time, so memory use does not
+depend on the number of snapshots.
+
+By default the last snapshot of every file is taken and files are summed, as if they
+came from different HMS instances. With --rates all snapshots are treated as successive
+dumps of one instance and call rates and weight deltas are printed for every interval.
+--top prints where HMS spends time: top timers and histograms by weight,
+counters and gauges by value.
+"""
+
+from __future__ import print_function
+
 import csv
 import json
+import os
+import re
 from argparse import ArgumentParser
+from sys import stdin, stdout
 
+API_PREFIX = 'api_'
+CHUNK_SIZE = 1 << 20
+SECTIONS = ['timers', 'histograms', 'counters', 'gauges']
+_WHITESPACE = re.compile(r'\s*')
 
-"""
-Given Hive metrics file, print in CSV statistics about each api
-"""
-if __name__ == '__main__':
-    parser = ArgumentParser()
-    parser.add_argument('--dummy', help='dummy argument')
+
+def iter_json(f, chunk_size=CHUNK_SIZE):
+    """
+    Parse concatenated JSON objects from a file.
+
+    Decoding is retried only after the buffer doubles and decoded objects are
+    dropped from the buffer only when it is refilled, so large objects and
+    files with many objects are parsed in linear time.
+
+    :param f: text file
+    :return: generator of parsed objects
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    idx = 0
+    retry_size = 0
+    while True:
+        chunk = f.read(chunk_size)
+        buf = buf[idx:] + chunk
+        idx = 0
+        while True:
+            idx = _WHITESPACE.match(buf, idx).end()
+            if idx == len(buf) or (chunk and len(buf) - idx < retry_size):
+                break
+            try:
+                obj, idx = decoder.raw_decode(buf, idx)
+            except ValueError:
+                if not chunk:
+                    raise
+                retry_size = 2 * (len(buf) - idx)
+                break
+            retry_size = 0
+            yield obj
+        if not chunk:
+            return
+
+
+def read_snapshots(names, interval=None):
+    """
+    Read snapshots from files in order
+
+    :param names: file names, stdin if empty
+    :param interval: seconds between successive snapshots, if known
+    :return: generator of (file name, snapshot, timestamp) tuples; timestamp is taken from
+        the snapshot 'timestamp' field, derived from interval or, for files with one snapshot,
+        from file modification time. It is None if unknown.
+    """
+    elapsed = 0.0
+    for name in names or ['-']:
+        f = stdin if name == '-' else open(name)
+        try:
+            count = 0
+            pending = None
+            for snapshot in iter_json(f):
+                if pending:
+                    yield pending
+                count += 1
+                timestamp = snapshot.get('timestamp')
+                if timestamp is not None and timestamp > 1e11:
+                    # Milliseconds
+                    timestamp /= 1000.0
+                if timestamp is None and interval:
+                    timestamp = elapsed
+                    elapsed += interval
+                pending = (name, snapshot, timestamp)
+            if pending:
+                if pending[2] is None and count == 1 and name != '-':
+                    pending = (name, pending[1], os.path.getmtime(name))
+                yield pending
+        finally:
+            if f is not stdin:
+                f.close()
+
+
+def api_name(name):
+    return name[len(API_PREFIX):] if name.startswith(API_PREFIX) else name
+
+
+def timers(snapshot):
+    """
+    :return: maps api name to timer values from the snapshot
+    :rtype: dict
+    """
+    return {api_name(name): values for name, values in snapshot.get('timers', {}).items()}
+
+
+def weight(values):
+    """
+    :return: total time spent in the timer or histogram, count multiplied by mean value
+    """
+    return values.get('count', 0) * values.get('mean', 0)
+
+
+def metric_value(section, values):
+    """
+    :return: single number describing the metric: weight for timers and histograms,
+        count for counters, value for gauges, None for non-numeric gauges
+    """
+    if section in ('timers', 'histograms'):
+        return weight(values)
+    value = values.get('count') if section == 'counters' else values.get('value')
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def combine(snapshots):
+    """
+    Sum timers of snapshots from different instances
+
+    :param snapshots: list of snapshots
+    :return: maps api name to dict with weight, count, mean, min, max and p75.
+        p75 is the count-weighted mean of p75 values, an approximation.
+    :rtype: dict
+    """
+    result = {}
+    for snapshot in snapshots:
+        for api, values in timers(snapshot).items():
+            r = result.setdefault(api, {'weight': 0.0, 'count': 0, 'min': None, 'max': None, 'p75_weight': 0.0})
+            count = values.get('count', 0)
+            r['weight'] += weight(values)
+            r['count'] += count
+            r['p75_weight'] += count * values.get('p75', 0)
+            for key, fn in (('min', min), ('max', max)):
+                if values.get(key) is not None:
+                    r[key] = values[key] if r[key] is None else fn(r[key], values[key])
+    for r in result.values():
+        r['mean'] = r['weight'] / r['count'] if r['count'] else 0.0
+        r['p75'] = r.pop('p75_weight') / r['count'] if r['count'] else 0.0
+    return result
+
+
+def deltas(previous, current):
+    """
+    Per-api change between successive snapshots of one instance
+
+    :return: maps api name to (calls, weight delta); apis without calls are skipped
+    :rtype: dict
+    """
+    before = timers(previous)
+    result = {}
+    for api, values in timers(current).items():
+        old = before.get(api, {})
+        calls = values.get('count', 0) - old.get('count', 0)
+        if calls < 0:
+            # Counters were reset by a restart, the snapshot starts from zero
+            calls, old = values.get('count', 0), {}
+        if calls:
+            result[api] = (calls, weight(values) - weight(old))
+    return result
+
+
+def top(section, snapshots, baseline=None, count=10):
+    """
+    Largest metrics in a section, summed over snapshots of different instances.
+    With baseline, an earlier snapshot of the same instance, timers, histograms and counters
+    are compared by their change since the baseline.
+
+    :return: list of (name, value) sorted by decreasing value
+    """
+    values = {}
+    for snapshot in snapshots:
+        for name, v in snapshot.get(section, {}).items():
+            value = metric_value(section, v)
+            if value is not None:
+                values[name] = values.get(name, 0) + value
+    if baseline is not None and section != 'gauges':
+        for name, v in baseline.get(section, {}).items():
+            old = metric_value(section, v)
+            # Skip metrics reset by a restart
+            if name in values and old is not None and old <= values[name]:
+                values[name] -= old
+    return sorted(values.items(), key=lambda item: -item[1])[:count]
+
+
+def print_totals(writer, snapshots):
+    writer.writerow(['Name', 'Weight', 'Count', 'Mean', 'Min', 'Max', 'p75'])
+    combined = combine(snapshots)
+    for api in sorted(combined.keys()):
+        r = combined[api]
+        writer.writerow([api, r['weight'], r['count'], r['mean'], r['min'], r['max'], r['p75']])
+
+
+def print_top(file, snapshots, baseline, count):
+    for section in SECTIONS:
+        items = top(section, snapshots, baseline, count)
+        if not items:
+            continue
+        total = sum(v for _, v in items if v > 0)
+        file.write('\n{:60s}{:14s} {:8s}\n'.format('Top ' + section, 'Value', 'Share%'))
+        for name, value in items:
+            file.write('{:60s}{:<14.6g} {:<8.1f}\n'.format(name, value, value * 100.0 / total if total else 0.0))
+
+
+def main():
+    parser = ArgumentParser(description='Summarize Hive metastore metrics dumps')
+    parser.add_argument('--rates', action='store_true',
+                        help='treat snapshots as successive and print call rates for every interval')
+    parser.add_argument('--interval', type=float, help='seconds between successive snapshots')
+    parser.add_argument('--top', type=int, metavar='N', help='print top N timers, histograms, counters and gauges')
     parser.add_argument('files', metavar='FILE', nargs='*', help='files to read, if empty, stdin is used')
     args = parser.parse_args()
     writer = csv.writer(stdout, delimiter='\t', quotechar='|', quoting=csv.QUOTE_MINIMAL)
-    writer.writerow(['Name', 'Weight', 'Count', 'Mean', 'Min', 'Max', 'p75'])
 
-    for name in args.files:
-        with open(name) as f:
-            metric = json.load(f).get('timers')
-            for api in sorted(metric.keys()):
-                values = metric.get(api)
-                count = values.get('count')
-                mean = values.get('mean')
-                min = values.get('min')
-                max = values.get('max')
-                p75 = values.get('p75')
-                # Weight is count multiplied by mean value
-                weight = count * mean
-                writer.writerow([api[4:], weight, count, mean, min, max, p75])
+    first = None
+    previous = None
+    # Last snapshot of every file
+    latest = {}
+    if args.rates:
+        writer.writerow(['Start', 'End', 'Name', 'Calls', 'Rate', 'WeightDelta', 'Mean'])
+    for name, snapshot, timestamp in read_snapshots(args.files, args.interval):
+        if first is None:
+            first = snapshot
+        if args.rates and previous:
+            seconds = timestamp - previous[1] if timestamp is not None and previous[1] is not None else None
+            changes = deltas(previous[0], snapshot)
+            for api in sorted(changes.keys(), key=lambda a: -changes[a][1]):
+                calls, weight_delta = changes[api]
+                writer.writerow([previous[1], timestamp, api, calls,
+                                 calls / seconds if seconds else '', weight_delta, weight_delta / calls])
+        previous = (snapshot, timestamp)
+        latest[name] = snapshot
+    if not latest:
+        return 0
+    if not args.rates:
+        print_totals(writer, list(latest.values()))
+    if args.top:
+        if args.rates:
+            print_top(stdout, [previous[0]], first if first is not previous[0] else None, args.top)
+        else:
+            print_top(stdout, list(latest.values()), None, args.top)
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())